@@ -0,0 +1,49 @@
+"""
+Stand-in gRPC backends for the benchmarks, served on the addresses the app is configured with (by default
+127.0.0.1:50051-50054). Start them before importing anything that fetches secrets at import, e.g. src.utils.auth.
+
+Benchmarks run from the repository root, next to the generated proto packages, with the metrics port (8111) free:
+    python -m benchmarks.<name> --help
+"""
+import logging
+import os
+from concurrent import futures
+
+import grpc
+
+# No traces: there is no collector to export them to, and the exporter would retry it on exit
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+
+from secret import secret_pb2, secret_pb2_grpc
+from src.utils import DB_MANAGER_PORT, MONGO_MANAGER_PORT, PRICE_MANAGER_PORT
+from src.utils.logger import logger
+
+# The routers log every request
+logger.setLevel(logging.WARNING)
+
+
+class SecretStore(secret_pb2_grpc.SecretStoreServicer):
+    def GetSecret(self, request, context):
+        return secret_pb2.SecretValue(value=f"benchmark-{request.name}")
+
+
+def serve(port: str, *servicers, workers: int = 256) -> grpc.Server:
+    """
+    Serves (add_*Servicer_to_server, servicer) pairs on 127.0.0.1:port. A servicer waits in a worker thread,
+    so workers bounds the calls in flight.
+    """
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=workers))
+    for add_servicer, servicer in servicers:
+        add_servicer(servicer, server)
+    server.add_insecure_port(f"127.0.0.1:{port}")
+    server.start()
+    return server
+
+
+def serve_secrets() -> grpc.Server:
+    return serve(MONGO_MANAGER_PORT, (secret_pb2_grpc.add_SecretStoreServicer_to_server, SecretStore()))
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
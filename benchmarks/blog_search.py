@@ -0,0 +1,88 @@
+"""
+Index build time and query latency of the blog search index over synthetic posts.
+
+Posts draw their words from a Zipf-distributed vocabulary, so some terms are in nearly every post and most are
+rare. Queries of each kind are timed against BlogSearchIndex.search and, for comparison, against the scan over
+every post that clients ran before the endpoint existed.
+
+    python -m benchmarks.blog_search --posts 100000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.backend import percentile
+from blog import blog_pb2
+
+CONSONANTS = "bcdfgklmnprstvz"
+VOWELS = "aeiou"
+
+
+def generate_posts(count: int, vocabulary: list[str], seed: int) -> list[blog_pb2.BlogContent]:
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    lengths = [rng.randint(150, 400) for _ in range(count)]
+    words = rng.choices(vocabulary, weights, k=sum(lengths) + 5 * count)
+    posts, position = [], 0
+    for number, length in enumerate(lengths):
+        title = " ".join(words[position:position + 5])
+        content = " ".join(words[position + 5:position + 5 + length])
+        position += 5 + length
+        posts.append(blog_pb2.BlogContent(language="en" if number % 4 else "pl", title=title, content=content,
+                                          path=f"post-{number}"))
+    return posts
+
+
+def scan(posts: list[blog_pb2.BlogContent], query: str) -> int:
+    terms = query.lower().split()
+    return sum(1 for post in posts if post.language == "en" and any(term in post.content.lower() for term in terms))
+
+
+def main(args: argparse.Namespace):
+    from src.utils.blog_search import BlogSearchIndex
+
+    rng = random.Random(args.seed)
+    vocabulary = [f"{rng.choice(CONSONANTS)}{rng.choice(VOWELS)}{rng.choice(CONSONANTS)}{rank}"
+                  for rank in range(args.vocabulary)]
+    start = time.perf_counter()
+    posts = generate_posts(args.posts, vocabulary, args.seed)
+    print(f"generated {len(posts)} posts in {time.perf_counter() - start:.1f} s")
+
+    index = BlogSearchIndex(refresh_interval=600, max_postings=args.max_postings)
+    start = time.perf_counter()
+    index._documents, index._languages = index._build(posts, args.max_postings)
+    print(f"built the index in {time.perf_counter() - start:.1f} s")
+
+    query_kinds = {
+        "rare": lambda: rng.choices(vocabulary[5000:], k=2),
+        "mid": lambda: rng.choices(vocabulary[100:2000], k=2),
+        "common": lambda: rng.choices(vocabulary[:20], k=2),
+        "mixed": lambda: rng.choices(vocabulary[:20], k=1) + rng.choices(vocabulary[2000:], k=2),
+    }
+    for kind, pick in query_kinds.items():
+        queries = [" ".join(pick()) for _ in range(args.queries)]
+        latencies, totals = [], []
+        for query in queries:
+            start = time.perf_counter()
+            total, _ = index.search(query, "en", 0, 10)
+            latencies.append(time.perf_counter() - start)
+            totals.append(total)
+        scans = []
+        for query in queries[:args.scans]:
+            start = time.perf_counter()
+            scan(posts, query)
+            scans.append(time.perf_counter() - start)
+        print(f"{kind:6s} index p50 {percentile(latencies, 0.5) * 1000:7.2f} ms  "
+              f"p95 {percentile(latencies, 0.95) * 1000:7.2f} ms  "
+              f"mean matches {sum(totals) / len(totals):9,.0f}  |  scan p50 {percentile(scans, 0.5) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000, help="distinct words")
+    parser.add_argument("--max-postings", type=int, default=10_000, help="see BLOG_SEARCH_MAX_POSTINGS")
+    parser.add_argument("--queries", type=int, default=200, help="queries of each kind")
+    parser.add_argument("--scans", type=int, default=5, help="queries of each kind also run as a scan")
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
@@ -0,0 +1,48 @@
+"""
+Throughput of bearer token verification with and without the verified token cache.
+
+Every authenticated request verifies its token; a page view sends many requests with the same one. Compares
+decoding and HMAC-verifying each time (verify_jwt_token, as before the cache) with verify_jwt_token_cached,
+for a working set of --tokens distinct tokens. A working set above JWT_CACHE_MAX_SIZE shows the cost of misses.
+
+    python -m benchmarks.jwt_cache --tokens 100 --verifications 200000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.backend import serve_secrets
+
+
+def run(name: str, verify, tokens: list[str], verifications: int):
+    sequence = random.Random(0).choices(tokens, k=verifications)
+    start = time.perf_counter()
+    for token in sequence:
+        verify(token)
+    elapsed = time.perf_counter() - start
+    print(f"{name:9s} {verifications / elapsed:10,.0f} verifications/s  {elapsed / verifications * 1e6:6.2f} µs each")
+
+
+def main(args: argparse.Namespace):
+    from src.utils import JWT_CACHE_MAX_SIZE
+    from src.utils.auth import create_jwt_token, verified_tokens, verify_jwt_token, verify_jwt_token_cached
+
+    tokens = [create_jwt_token({"id": str(user), "email": f"user{user}@example.com", "login": f"user{user}",
+                                "user_type": 1}) for user in range(args.tokens)]
+    print(f"{args.tokens} tokens, cache size {JWT_CACHE_MAX_SIZE}")
+    run("uncached", verify_jwt_token, tokens, args.verifications)
+    verified_tokens.clear()
+    run("cached", verify_jwt_token_cached, tokens, args.verifications)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=100, help="distinct tokens in use")
+    parser.add_argument("--verifications", type=int, default=200_000)
+    arguments = parser.parse_args()
+
+    server = serve_secrets()
+    try:
+        main(arguments)
+    finally:
+        server.stop(None)
@@ -0,0 +1,124 @@
+"""
+Duration of one payment scheduler run over a backlog of unpaid Checkout Sessions.
+
+Compares the run as it was (every session retrieved from Stripe and every payment updated one after the other)
+with check_for_payments, which checks sessions on a bounded worker pool over one keep-alive connection pool and
+sends the run's updates together. Stripe is a local stand-in answering after --stripe-latency seconds; about 40%
+of its sessions are settled, so their payments get updated.
+
+    python -m benchmarks.payment_polling --sessions 1000
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import stripe
+
+from benchmarks.backend import DB_MANAGER_PORT, serve
+from payment import payment_pb2, payment_pb2_grpc, payment_state_pb2
+
+
+class StripeSessions(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which Nagle would hold back for a delayed ACK on keep-alive
+    disable_nagle_algorithm = True
+    latency = 0.0
+    connections: set[tuple[str, int]] = set()
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        StripeSessions.connections.add(self.client_address)
+        session_id = self.path.rsplit("/", 1)[-1]
+        draw = random.Random(session_id).random()
+        payment_status, status = ("paid", "complete") if draw < 0.3 else ("unpaid", "expired") if draw < 0.4 \
+            else ("unpaid", "open")
+        body = json.dumps({"id": session_id, "object": "checkout.session", "payment_status": payment_status,
+                           "status": status, "created": int(time.time()) - 3600,
+                           "expires_at": int(time.time()) + 3600}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Payments(payment_pb2_grpc.PaymentServicer):
+    def __init__(self, sessions: int, latency: float):
+        self.latency = latency
+        self.updates = 0
+        self.response = payment_pb2.PaymentList(payments=[
+            payment_pb2.PaymentDetails(id=f"cs_test_{i}", state=payment_state_pb2.PAYMENT_STATE_PENDING)
+            for i in range(sessions)
+        ])
+
+    def GetUnpaidPayments(self, request, context):
+        time.sleep(self.latency)
+        return self.response
+
+    def UpdatePayment(self, request, context):
+        time.sleep(self.latency)
+        self.updates += 1
+        return request
+
+
+def sequential_check_for_payments():
+    """
+    check_for_payments before the change, without its logging.
+    """
+    from src.connections import payment_stub
+    from src.utils.payment_scheduler import payment_update
+
+    pending_payments = payment_stub.GetUnpaidPayments(payment_pb2.UnpaidSessions(unpaid=True))
+    for payment in pending_payments.payments:
+        session = stripe.checkout.Session.retrieve(payment.id)
+        update_message = payment_update(payment.id, (session.payment_status, session.status))
+        if update_message is not None:
+            payment_stub.UpdatePayment(update_message)
+
+
+def run(name: str, check, payments: Payments):
+    payments.updates = 0
+    StripeSessions.connections.clear()
+    start = time.perf_counter()
+    check()
+    elapsed = time.perf_counter() - start
+    print(f"{name:10s} {len(payments.response.payments)} sessions in {elapsed:6.2f} s, {payments.updates} updates, "
+          f"{len(StripeSessions.connections)} Stripe connections")
+
+
+def main(args: argparse.Namespace, payments: Payments):
+    from src.utils import PAYMENT_POLL_WORKERS
+    from src.utils.payment_scheduler import check_for_payments
+
+    print(f"{PAYMENT_POLL_WORKERS} poll workers")
+    run("sequential", sequential_check_for_payments, payments)
+    run("pooled", check_for_payments, payments)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=1000, help="unpaid payments in the backlog")
+    parser.add_argument("--stripe-latency", type=float, default=0.05, help="seconds per Checkout Session retrieve")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per DB_Manager call")
+    arguments = parser.parse_args()
+
+    StripeSessions.latency = arguments.stripe_latency
+    stripe_server = ThreadingHTTPServer(("127.0.0.1", 0), StripeSessions)
+    stripe_server.daemon_threads = True
+    threading.Thread(target=stripe_server.serve_forever, daemon=True).start()
+    stripe.api_key = "sk_test_benchmark"
+    stripe.api_base = f"http://127.0.0.1:{stripe_server.server_port}"
+
+    payments_servicer = Payments(arguments.sessions, arguments.latency)
+    server = serve(DB_MANAGER_PORT, (payment_pb2_grpc.add_PaymentServicer_to_server, payments_servicer))
+    try:
+        main(arguments, payments_servicer)
+    finally:
+        server.stop(None)
+        stripe_server.shutdown()
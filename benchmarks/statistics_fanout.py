@@ -0,0 +1,137 @@
+"""
+Latency of /api/statistics/portfolio-diversity for a user with many wallets, under concurrent clients.
+
+Compares the endpoint as it was (sync stubs called one after the other on the event loop) with the current one,
+which awaits the wallet list and the price snapshot together. Both run against stand-in backends that answer
+every call after --latency seconds.
+
+    python -m benchmarks.statistics_fanout --wallets 500 --clients 40
+"""
+import argparse
+import asyncio
+import time
+
+from google.protobuf import struct_pb2
+from google.protobuf.json_format import MessageToDict
+from starlette.requests import Request
+
+from benchmarks.backend import DB_MANAGER_PORT, PRICE_MANAGER_PORT, percentile, serve, serve_secrets
+from coins import coins_pb2, coins_pb2_grpc
+from wallet import wallet_pb2, wallet_pb2_grpc
+
+COINS = ["bitcoin", "ethereum", "ripple", "solana", "cardano"]
+
+
+class Wallets(wallet_pb2_grpc.WalletsServicer):
+    def __init__(self, wallets: int, latency: float):
+        self.latency = latency
+        self.response = wallet_pb2.WalletList(wallets=[
+            wallet_pb2.Wallet(id=str(i), currency=COINS[i % len(COINS)], value="1.5", user_id="1", is_crypto=True)
+            for i in range(wallets)
+        ])
+
+    def GetUsersWallets(self, request, context):
+        time.sleep(self.latency)
+        return self.response
+
+
+class Coins(coins_pb2_grpc.CoinsServicer):
+    def __init__(self, latency: float):
+        self.latency = latency
+        data = struct_pb2.Struct()
+        data.update({coin: {"usd": 100.0, "eur": 90.0, "pln": 400.0} for coin in COINS})
+        self.response = coins_pb2.DataResponse(status="success", data=data)
+
+    def GetAllCoinsPrices(self, request, context):
+        time.sleep(self.latency)
+        return self.response
+
+
+async def blocking_portfolio_diversity(request: Request):
+    """
+    The endpoint before the change, reduced to its backend calls.
+    """
+    from src.connections import wallet_stub, prices_stub
+    from src.utils.auth import verify_user
+
+    jwt_payload = verify_user(request.headers.get("Authorization"))
+    wallets = MessageToDict(wallet_stub.GetUsersWallets(wallet_pb2.UserID(id=jwt_payload["id"])),
+                            preserving_proto_field_name=True)
+    prices = MessageToDict(prices_stub.GetAllCoinsPrices(coins_pb2.AllCoinsPricesRequest()))["data"]
+    return sum(float(wallet["value"]) * prices[wallet["currency"]]["usd"] for wallet in wallets["wallets"])
+
+
+async def measure_loop_lag(stop: asyncio.Event, lags: list[float], interval: float = 0.005):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def run(name: str, handler, request: Request, clients: int, rounds: int):
+    """
+    Sends rounds bursts of clients concurrent requests. A request's latency counts from the start of its burst,
+    so time spent waiting for a blocked event loop is included.
+    """
+    latencies, lags = [], []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop, lags))
+
+    async def send(burst_start: float):
+        await handler(request)
+        latencies.append(time.perf_counter() - burst_start)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        burst_start = time.perf_counter()
+        await asyncio.gather(*(send(burst_start) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await lag_task
+    print(f"{name:9s} p50 {percentile(latencies, 0.5) * 1000:7.1f} ms  p99 {percentile(latencies, 0.99) * 1000:7.1f} ms"
+          f"  {len(latencies) / elapsed:6.1f} req/s  max loop lag {max(lags, default=0) * 1000:6.1f} ms")
+
+
+async def main(args: argparse.Namespace):
+    from src.connections import aio
+    from src.router.statistics import get_portfolio_diversity
+    from src.utils.auth import create_jwt_token
+    from src.utils.price_snapshot import price_snapshot
+
+    token = create_jwt_token({"id": "1", "user_type": 1})
+    request = Request({"type": "http", "method": "GET", "path": "/api/statistics/portfolio-diversity",
+                       "query_string": b"", "headers": [(b"authorization", f"Bearer {token}".encode())]})
+    if args.fetch_prices:
+        # A snapshot older than max_stale is fetched by the request, so every request has both calls in flight
+        price_snapshot.max_stale = -1
+
+    await aio.connect()
+    try:
+        await run("blocking", blocking_portfolio_diversity, request, args.clients, args.rounds)
+        await run("fan-out", lambda request: get_portfolio_diversity(request, None, "usd"), request, args.clients,
+                  args.rounds)
+    finally:
+        await aio.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--wallets", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per backend call")
+    parser.add_argument("--clients", type=int, default=40, help="concurrent requests per burst")
+    parser.add_argument("--rounds", type=int, default=5, help="bursts")
+    parser.add_argument("--cached-prices", dest="fetch_prices", action="store_false",
+                        help="serve prices from the snapshot instead of fetching them on every request")
+    arguments = parser.parse_args()
+
+    servers = [
+        serve_secrets(),
+        serve(DB_MANAGER_PORT, (wallet_pb2_grpc.add_WalletsServicer_to_server,
+                                Wallets(arguments.wallets, arguments.latency))),
+        serve(PRICE_MANAGER_PORT, (coins_pb2_grpc.add_CoinsServicer_to_server, Coins(arguments.latency))),
+    ]
+    try:
+        asyncio.run(main(arguments))
+    finally:
+        for server in servers:
+            server.stop(None)
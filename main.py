@@ -1,13 +1,28 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from fastapi.openapi.models import SecurityScheme
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import uvicorn
+import sys
 
+from src.connections import aio
 from src.router import access, wallets, user, order, payments, currency, healthcheck, crypto_data, blog, statistics
 from src.utils.logger import logger
-from src.utils.payment_scheduler import setup_payments_scheduler
+from src.utils.price_snapshot import price_snapshot
+from src.utils.currency_registry import currency_registry
+from src.utils.blog_search import blog_search
+from src.utils.compression import CompressionMiddleware
+from src.utils.etag import ETagMiddleware
+from src.utils.http_metrics import HTTPMetricsMiddleware
+from src.utils.outbox import outbox
+from src.utils.PasswordsValidator.password_validator import start_hash_workers, stop_hash_workers
+from src.utils.payment_scheduler import payment_scheduler
+from src.utils.proto_json import ProtoJSONResponse
+from src.utils.auth import is_super_admin
+from src.utils.server_timing import ServerTimingMiddleware
+from src.utils.deadline import DeadlineMiddleware
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 
 security = HTTPBearer()
@@ -45,7 +60,26 @@ def custom_openapi():
     return app.openapi_schema
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_hash_workers()
+    await aio.connect()
+    await outbox.start()
+    await price_snapshot.start()
+    await currency_registry.start()
+    await blog_search.start()
+    payment_scheduler.start()
+    yield
+    payment_scheduler.stop()
+    await blog_search.stop()
+    await currency_registry.stop()
+    await price_snapshot.stop()
+    await outbox.stop()
+    await aio.close()
+    stop_hash_workers()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ProtoJSONResponse)
 FastAPIInstrumentor().instrument_app(app)
 
 app.openapi = custom_openapi
@@ -57,6 +91,13 @@ origins = [
     "http://thdc.tail8ec47f.ts.net"
 ]
 
+app.add_middleware(ETagMiddleware)
+# Added after ETagMiddleware so it runs outside it and ETags cover the uncompressed body
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ServerTimingMiddleware, authorized=is_super_admin)
+app.add_middleware(DeadlineMiddleware)
+# Outside every middleware that changes the status, so the metrics record the one sent to the client
+app.add_middleware(HTTPMetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -78,9 +119,5 @@ app.include_router(statistics.statistics_router, prefix="/api/statistics")
 
 
 if __name__ == "__main__":
-    logger.info("Setting up payments scheduler")
-    setup_payments_scheduler()
-    logger.info("Scheduler started")
-
-    logger.info("Server starting...")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Not served from here: multiprocessing workers re-run the main script, and this one starts the whole app
+    sys.exit("Start the server with: uvicorn main:app --host 0.0.0.0 --port 8000")
\ No newline at end of file
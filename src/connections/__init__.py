@@ -3,6 +3,7 @@ from opentelemetry.instrumentation.grpc import GrpcInstrumentorClient
 from prometheus_client import start_http_server
 from py_grpc_prometheus.prometheus_client_interceptor import PromClientInterceptor
 import src.utils.OpenTelemetry.OpenTelemetry as oTEL
+from src.connections.interceptors import DeadlineClientInterceptor
 
 from src.utils import DB_MANAGER_PORT, THD_DB_Manager, MONGO_MANAGER_PORT, MONGO_MANAGER, PRICE_MANAGER, \
     PRICE_MANAGER_PORT, ORDERS_SERVICE_PORT, ORDERS_SERVICE
@@ -25,7 +26,8 @@ start_http_server(8111)
 try:
 
     db_manager_channel = grpc.insecure_channel(f'{THD_DB_Manager}:{DB_MANAGER_PORT}')
-    db_manager_channel = grpc.intercept_channel(db_manager_channel, prometheus_interceptor)
+    db_manager_channel = grpc.intercept_channel(db_manager_channel, prometheus_interceptor,
+                                                DeadlineClientInterceptor("db_manager"))
 
     user_stub = user_pb2_grpc.UserStub(db_manager_channel)
     wallet_stub = wallet_pb2_grpc.WalletsStub(db_manager_channel)
@@ -33,7 +35,8 @@ try:
     payment_stub = payment_pb2_grpc.PaymentStub(db_manager_channel)
 
     mongo_manager_channel = grpc.insecure_channel(f'{MONGO_MANAGER}:{MONGO_MANAGER_PORT}')
-    mongo_manager_channel = grpc.intercept_channel(mongo_manager_channel, prometheus_interceptor)
+    mongo_manager_channel = grpc.intercept_channel(mongo_manager_channel, prometheus_interceptor,
+                                                   DeadlineClientInterceptor("mongo_manager"))
 
     secret_stub = secret_pb2_grpc.SecretStoreStub(mongo_manager_channel)
     password_stub = password_pb2_grpc.PasswordCheckerStub(mongo_manager_channel)
@@ -41,12 +44,14 @@ try:
     blog_stub = blog_pb2_grpc.BlogStub(mongo_manager_channel)
 
     price_manager_channel = grpc.insecure_channel(f'{PRICE_MANAGER}:{PRICE_MANAGER_PORT}')
-    price_manager_channel = grpc.intercept_channel(price_manager_channel, prometheus_interceptor)
+    price_manager_channel = grpc.intercept_channel(price_manager_channel, prometheus_interceptor,
+                                                   DeadlineClientInterceptor("price_manager"))
 
     prices_stub = coins_pb2_grpc.CoinsStub(price_manager_channel)
 
     orders_service_channel = grpc.insecure_channel(f'{ORDERS_SERVICE}:{ORDERS_SERVICE_PORT}')
-    orders_service_channel = grpc.intercept_channel(orders_service_channel)
+    orders_service_channel = grpc.intercept_channel(orders_service_channel,
+                                                    DeadlineClientInterceptor("orders_service"))
 
     orders_service_order_stub = order_pb2_grpc.OrderStub(orders_service_channel)
     orders_service_wallet_stub = wallet_pb2_grpc.WalletsStub(orders_service_channel)
@@ -0,0 +1,88 @@
+import grpc
+from opentelemetry.instrumentation.grpc import GrpcAioInstrumentorClient
+
+from src.connections import prometheus_interceptor
+from src.connections.interceptors import PromAioClientInterceptor, ServerTimingAioClientInterceptor, \
+    DeadlineAioClientInterceptor
+from src.utils import DB_MANAGER_PORT, THD_DB_Manager, MONGO_MANAGER_PORT, MONGO_MANAGER, PRICE_MANAGER, \
+    PRICE_MANAGER_PORT, ORDERS_SERVICE_PORT, ORDERS_SERVICE, BLOG_SEARCH_MAX_MESSAGE_BYTES
+from user import user_pb2_grpc
+from wallet import wallet_pb2_grpc
+from order import order_pb2_grpc
+from payment import payment_pb2_grpc
+from secret import secret_pb2_grpc
+from password import password_pb2_grpc
+from currency import currency_pb2_grpc
+from coins import coins_pb2_grpc
+from blog import blog_pb2_grpc
+
+from src.utils.logger import logger
+
+# Stubs are created inside the running event loop by connect(), so they are looked up as
+# module attributes (aio.user_stub) instead of being imported by name.
+GrpcAioInstrumentorClient().instrument()
+prometheus_aio_interceptor = PromAioClientInterceptor(prometheus_interceptor._metrics)
+
+channels: list[grpc.aio.Channel] = []
+
+user_stub: user_pb2_grpc.UserStub | None = None
+wallet_stub: wallet_pb2_grpc.WalletsStub | None = None
+order_stub: order_pb2_grpc.OrderStub | None = None
+payment_stub: payment_pb2_grpc.PaymentStub | None = None
+
+secret_stub: secret_pb2_grpc.SecretStoreStub | None = None
+password_stub: password_pb2_grpc.PasswordCheckerStub | None = None
+currency_stub: currency_pb2_grpc.CurrencyStub | None = None
+blog_stub: blog_pb2_grpc.BlogStub | None = None
+
+prices_stub: coins_pb2_grpc.CoinsStub | None = None
+
+orders_service_order_stub: order_pb2_grpc.OrderStub | None = None
+orders_service_wallet_stub: wallet_pb2_grpc.WalletsStub | None = None
+
+
+def _insecure_channel(target: str, backend: str, options: list[tuple[str, int]] | None = None) -> grpc.aio.Channel:
+    channel = grpc.aio.insecure_channel(target, options=options, interceptors=[
+        prometheus_aio_interceptor, ServerTimingAioClientInterceptor(backend), DeadlineAioClientInterceptor(backend)
+    ])
+    channels.append(channel)
+    return channel
+
+
+async def connect():
+    global user_stub, wallet_stub, order_stub, payment_stub, secret_stub, password_stub, currency_stub, \
+        blog_stub, prices_stub, orders_service_order_stub, orders_service_wallet_stub
+
+    db_manager_channel = _insecure_channel(f'{THD_DB_Manager}:{DB_MANAGER_PORT}', "db_manager")
+
+    user_stub = user_pb2_grpc.UserStub(db_manager_channel)
+    wallet_stub = wallet_pb2_grpc.WalletsStub(db_manager_channel)
+    order_stub = order_pb2_grpc.OrderStub(db_manager_channel)
+    payment_stub = payment_pb2_grpc.PaymentStub(db_manager_channel)
+
+    # Above the 4 MB default, as the blog search index is built from a single GetBlogs response
+    mongo_manager_channel = _insecure_channel(f'{MONGO_MANAGER}:{MONGO_MANAGER_PORT}', "mongo_manager", [
+        ("grpc.max_receive_message_length", BLOG_SEARCH_MAX_MESSAGE_BYTES)
+    ])
+
+    secret_stub = secret_pb2_grpc.SecretStoreStub(mongo_manager_channel)
+    password_stub = password_pb2_grpc.PasswordCheckerStub(mongo_manager_channel)
+    currency_stub = currency_pb2_grpc.CurrencyStub(mongo_manager_channel)
+    blog_stub = blog_pb2_grpc.BlogStub(mongo_manager_channel)
+
+    price_manager_channel = _insecure_channel(f'{PRICE_MANAGER}:{PRICE_MANAGER_PORT}', "price_manager")
+
+    prices_stub = coins_pb2_grpc.CoinsStub(price_manager_channel)
+
+    orders_service_channel = _insecure_channel(f'{ORDERS_SERVICE}:{ORDERS_SERVICE_PORT}', "orders_service")
+
+    orders_service_order_stub = order_pb2_grpc.OrderStub(orders_service_channel)
+    orders_service_wallet_stub = wallet_pb2_grpc.WalletsStub(orders_service_channel)
+
+    logger.info("Async gRPC channels created")
+
+
+async def close():
+    while channels:
+        await channels.pop().close()
+    logger.info("Async gRPC channels closed")
@@ -0,0 +1,130 @@
+import time
+from collections import namedtuple
+from timeit import default_timer
+
+import grpc
+from py_grpc_prometheus import grpc_utils
+
+from src.utils.deadline import deadline_exceeded, rpc_timeout
+from src.utils.server_timing import current_timing
+
+
+def split_method(client_call_details) -> tuple[str, str]:
+    method = client_call_details.method
+    if isinstance(method, bytes):
+        method = method.decode()
+
+    # e.g. /package.ServiceName/MethodName
+    parts = method.split("/")
+    if len(parts) < 3:
+        return "", ""
+    return parts[1], parts[2]
+
+
+class PromAioClientInterceptor(grpc.aio.UnaryUnaryClientInterceptor):
+    """
+    grpc.aio counterpart of PromClientInterceptor, recording into the same metric families.
+    """
+
+    def __init__(self, metrics: dict):
+        self._metrics = metrics
+
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        grpc_service_name, grpc_method_name = split_method(client_call_details)
+        grpc_type = grpc_utils.UNARY
+
+        self._metrics["grpc_client_started_counter"].labels(
+            grpc_type=grpc_type,
+            grpc_service=grpc_service_name,
+            grpc_method=grpc_method_name).inc()
+
+        start = default_timer()
+        call = await continuation(client_call_details, request)
+        try:
+            await call
+        finally:
+            self._metrics["grpc_client_handled_histogram"].labels(
+                grpc_type=grpc_type,
+                grpc_service=grpc_service_name,
+                grpc_method=grpc_method_name).observe(max(default_timer() - start, 0))
+
+            self._metrics["grpc_client_handled_counter"].labels(
+                grpc_type=grpc_type,
+                grpc_service=grpc_service_name,
+                grpc_method=grpc_method_name,
+                grpc_code=(await call.code()).name).inc()
+
+        return call
+
+
+class ServerTimingAioClientInterceptor(grpc.aio.UnaryUnaryClientInterceptor):
+    """
+    Adds every RPC made while handling a timed request to its Server-Timing header as <backend>.<method>, with
+    the status code as description when the call failed.
+    """
+
+    def __init__(self, backend: str):
+        self.backend = backend
+
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        timing = current_timing.get()
+        if timing is None:
+            return await continuation(client_call_details, request)
+
+        _, grpc_method_name = split_method(client_call_details)
+        start = time.perf_counter()
+        call = await continuation(client_call_details, request)
+        try:
+            await call
+        finally:
+            code = await call.code()
+            timing.add(f"{self.backend}.{grpc_method_name}", time.perf_counter() - start,
+                       None if code == grpc.StatusCode.OK else code.name)
+        return call
+
+
+class DeadlineAioClientInterceptor(grpc.aio.UnaryUnaryClientInterceptor):
+    """
+    Sets the timeout of every call from rpc_timeout and records calls that ran out of it.
+    """
+
+    def __init__(self, backend: str):
+        self.backend = backend
+
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        _, grpc_method_name = split_method(client_call_details)
+        timeout, request_limited = rpc_timeout(client_call_details.timeout)
+        call = await continuation(client_call_details._replace(timeout=timeout), request)
+        if await call.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+            deadline_exceeded(self.backend, grpc_method_name, request_limited)
+        return call
+
+
+class ClientCallDetails(namedtuple("ClientCallDetails",
+                                   ("method", "timeout", "metadata", "credentials", "wait_for_ready", "compression")),
+                        grpc.ClientCallDetails):
+    pass
+
+
+class DeadlineClientInterceptor(grpc.UnaryUnaryClientInterceptor):
+    """
+    Sync counterpart of DeadlineAioClientInterceptor, for the channels used by background threads.
+    """
+
+    def __init__(self, backend: str):
+        self.backend = backend
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        _, grpc_method_name = split_method(client_call_details)
+        timeout, request_limited = rpc_timeout(client_call_details.timeout)
+        details = ClientCallDetails(client_call_details.method, timeout, client_call_details.metadata,
+                                    client_call_details.credentials, client_call_details.wait_for_ready,
+                                    client_call_details.compression)
+
+        def record_deadline_exceeded(call):
+            if call.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+                deadline_exceeded(self.backend, grpc_method_name, request_limited)
+
+        response = continuation(details, request)
+        response.add_done_callback(record_deadline_exceeded)
+        return response
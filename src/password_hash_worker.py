@@ -0,0 +1,11 @@
+"""
+Code run by the password hash workers. The forkserver they start from preloads this module, so it must not have
+import side effects: no src.utils (logging) or src.connections (channels, metrics server) imports.
+"""
+from argon2 import PasswordHasher
+
+password_hasher = PasswordHasher()
+
+
+def argon2_hash(password: str, salt: str) -> str:
+    return password_hasher.hash(password, salt=salt.encode())
@@ -1,6 +1,7 @@
 import hashlib
 
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from grpc import RpcError
 from pydantic import BaseModel
 
@@ -8,7 +9,7 @@ from google.oauth2 import id_token
 from google.auth.transport import requests
 
 from secret import secret_pb2
-from src.connections import secret_stub, user_stub
+from src.connections import secret_stub, aio
 from src.utils.auth import create_jwt_token
 from user import user_pb2
 
@@ -79,12 +80,12 @@ access = APIRouter(tags=['Auth'])
         }
     }
 }, description="Authorize the user who has the account already created.")
-def login(credentials: Credentials):
-    credentials.password = hash_password(credentials.password)
+async def login(credentials: Credentials):
+    credentials.password = await hash_password(credentials.password)
     credentials = user_pb2.AuthUser(**credentials.model_dump())
 
     try:
-        response: user_pb2.AuthResponse = user_stub.Authenticate(credentials)
+        response: user_pb2.AuthResponse = await aio.user_stub.Authenticate(credentials)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
@@ -141,18 +142,18 @@ def login(credentials: Credentials):
         }
     }
 }, description="Create and authorize new account.")
-def register_user(registerData: RegisterData):
+async def register_user(registerData: RegisterData):
     no_hashed_password = registerData.password
     try:
-        validate_password(registerData.password)
-        registerData.password = hash_password(registerData.password)
+        await validate_password(registerData.password)
+        registerData.password = await hash_password(registerData.password)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
     data_for_grpc = user_pb2.RegUser(**registerData.model_dump())
 
     try:
-        response: user_pb2.RegResponse = user_stub.Register(data_for_grpc)
+        response: user_pb2.RegResponse = await aio.user_stub.Register(data_for_grpc)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
@@ -162,7 +163,7 @@ def register_user(registerData: RegisterData):
         raise HTTPException(status_code=400, detail="email_or_username_occupied")
 
     login_data = Credentials(login=registerData.email, password=no_hashed_password)
-    login_response = login(login_data)
+    login_response = await login(login_data)
     logger.info(f"Account created successfully. Permissions granted for user {login_response['username']}")
     return login_response
 
@@ -198,24 +199,25 @@ def register_user(registerData: RegisterData):
         }
     }
 }, description="enables access with google account")
-def auth_google(token: TokenRequest):
+async def auth_google(token: TokenRequest):
     try:
-        token_id_info = id_token.verify_token(token.OAuth_token, requests.Request(), GOOGLE_CLIENT_ID)
+        token_id_info = await run_in_threadpool(id_token.verify_token, token.OAuth_token, requests.Request(),
+                                                GOOGLE_CLIENT_ID)
         user_id = token_id_info.get("sub")
         email = token_id_info.get("email")
         pass_base = user_id + email
-        hashed_password = hash_password(pass_base)
+        hashed_password = await hash_password(pass_base)
 
         register_data = RegisterData(username=email, email=email, password=hashed_password)
         try:
-            register_response = register_user(register_data)
+            register_response = await register_user(register_data)
             logger.info("Successfully registered user with gmail")
 
             return register_response
         except HTTPException as e:
             if e.status_code == 400:
                 login_data = Credentials(login=email, password=hashed_password)
-                login_response = login(login_data)
+                login_response = await login(login_data)
                 login_response["oauthLogin"] = True
                 logger.info("User logged in using google")
                 return login_response
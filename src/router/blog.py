@@ -1,12 +1,15 @@
-from google.protobuf.json_format import MessageToDict
 from fastapi import APIRouter, HTTPException, Request, Query
 from grpc import RpcError
 from pydantic import BaseModel
 
-from src.connections import blog_stub
+from src.connections import aio
 from user import user_type_pb2
 from blog import blog_pb2
 from src.utils.auth import verify_user
+from src.utils.blog_cache import blog_cache
+from src.utils.blog_search import blog_search
+from src.utils.etag import not_modified
+from src.utils.proto_json import ProtoJSONResponse
 
 from src.utils.logger import logger
 
@@ -71,8 +74,8 @@ class BlogUpdateRequest(BaseModel):
         }
     }
 }, description='Creates new blog')
-def add_blog(request: Request,
-             blog_request: BlogRequest):
+async def add_blog(request: Request,
+                   blog_request: BlogRequest):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
@@ -85,7 +88,7 @@ def add_blog(request: Request,
                                                                       content=blog_request.content)
 
     try:
-        blog_response: blog_pb2.BlogContent = blog_stub.AddBlog(blog_request_message)
+        blog_response: blog_pb2.BlogContent = await aio.blog_stub.AddBlog(blog_request_message)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
@@ -94,9 +97,9 @@ def add_blog(request: Request,
         logger.error("Blog has not been added!")
         raise HTTPException(status_code=400, detail="operation_failed")
     else:
-        return MessageToDict(blog_response,
-                             preserving_proto_field_name=True,
-                             always_print_fields_with_no_presence=True)
+        blog_cache.invalidate(blog_response.language, blog_response.path)
+        blog_search.upsert(blog_response)
+        return ProtoJSONResponse(blog_response, always_print_fields_with_no_presence=True)
 
 
 @blog_router.put("/", responses={
@@ -144,8 +147,8 @@ def add_blog(request: Request,
         }
     }
 }, description='Updates already existing blog. Uses path and language as reference.')
-def update_blog(request: Request,
-                blog_update_request: BlogUpdateRequest):
+async def update_blog(request: Request,
+                      blog_update_request: BlogUpdateRequest):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
@@ -156,18 +159,20 @@ def update_blog(request: Request,
     blog_request_message: blog_pb2.BlogContent = blog_pb2.BlogContent(**blog_update_request.model_dump())
 
     try:
-        blog_response: blog_pb2.BlogContent = blog_stub.UpdateBlog(blog_request_message)
+        blog_response: blog_pb2.BlogContent = await aio.blog_stub.UpdateBlog(blog_request_message)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
+    finally:
+        # Also after an error - the update may have been applied before the call failed
+        blog_cache.invalidate(blog_update_request.language, blog_update_request.path)
 
     if blog_response.path == "*":
         logger.error("Blog has not been updated!")
         raise HTTPException(status_code=400, detail="operation_failed")
     else:
-        return MessageToDict(blog_response,
-                             preserving_proto_field_name=True,
-                             always_print_fields_with_no_presence=True)
+        blog_search.upsert(blog_request_message)
+        return ProtoJSONResponse(blog_response, always_print_fields_with_no_presence=True)
 
 
 @blog_router.get("/", responses={
@@ -220,27 +225,86 @@ def update_blog(request: Request,
         }
     }
 }, description='Lists all blogs matching to applied filters')
-def get_blog(
+async def get_blog(
+        request: Request,
         title: str | None = Query("", description="Blog title to filter by", ),
         language: str | None = Query("", description="Blog language to filter by"),
         path: str | None = Query("", description="Blog path to filter by")):
-    blog_filter_message: blog_pb2.FilterBlogMessage = blog_pb2.FilterBlogMessage(title=title,
-                                                                                 language=language,
-                                                                                 path=path)
-
     try:
-        blog_response: blog_pb2.BlogList = blog_stub.GetBlogs(blog_filter_message)
+        cached_blogs = await blog_cache.get(title or "", language or "", path or "")
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
 
+    blog_response: blog_pb2.BlogList = cached_blogs.blogs
     if len(blog_response.Blogs) == 0:
         logger.info("No blogs found")
         raise HTTPException(status_code=204)
-    else:
-        return MessageToDict(blog_response,
-                             preserving_proto_field_name=True,
-                             always_print_fields_with_no_presence=True)
+
+    return not_modified(request, cached_blogs.etag) or await cached_blogs.body.response(
+        request, headers={"ETag": cached_blogs.etag})
+
+
+@blog_router.get("/search", responses={
+    500: {
+        "description": "Problems occurred inside the server",
+        "content": {
+            "application/json": {
+                "example": {"detail": "internal_server_error"}
+            }
+        }
+    },
+    204: {
+        "description": "No blogs found"
+    },
+    200: {
+        "description": "Page of blogs ranked by relevance, snippets are HTML with matches wrapped in <mark>",
+        "content": {
+            "application/json": {
+                "example": {
+                    "total": 12,
+                    "page": 1,
+                    "page_size": 10,
+                    "results": [
+                        {
+                            "title": "string",
+                            "language": "en",
+                            "path": "string",
+                            "score": 4.2135,
+                            "snippet": "…the <mark>bitcoin</mark> price…"
+                        }
+                    ]
+                }
+            }
+        }
+    }
+}, description='Full-text search of blogs')
+async def search_blog(
+        q: str = Query(..., min_length=1, description="Words to search for"),
+        language: str | None = Query(None, description="Blog language to search in"),
+        page: int = Query(1, ge=1, description="Page of results"),
+        page_size: int = Query(10, ge=1, le=100, description="Results per page")):
+    try:
+        await blog_search.ensure_loaded()
+    except RpcError as e:
+        logger.error("gRPC error details:", e)
+        raise HTTPException(status_code=500, detail="internal_server_error")
+
+    total, hits = blog_search.search(q, language, (page - 1) * page_size, page_size)
+    if total == 0:
+        logger.info("No blogs found")
+        raise HTTPException(status_code=204)
+
+    return {
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "results": [{"title": hit.blog.title,
+                     "language": hit.blog.language,
+                     "path": hit.blog.path,
+                     "score": round(hit.score, 4),
+                     "snippet": hit.snippet} for hit in hits]
+    }
 
 
 @blog_router.delete("/", responses={
@@ -288,9 +352,9 @@ def get_blog(
         }
     }
 }, description='Deletes blog record specified with path and language')
-def delete_blog(request: Request,
-                path: str = Query(..., description="Path to blog"),
-                language: str = Query(..., description="Blog language"), ):
+async def delete_blog(request: Request,
+                      path: str = Query(..., description="Path to blog"),
+                      language: str = Query(..., description="Blog language"), ):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
@@ -302,15 +366,16 @@ def delete_blog(request: Request,
                                                                                  language=language)
 
     try:
-        blog_delete_response: blog_pb2.BlogContent = blog_stub.DeleteBlog(blog_delete_message)
+        blog_delete_response: blog_pb2.BlogContent = await aio.blog_stub.DeleteBlog(blog_delete_message)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
+    finally:
+        blog_cache.invalidate(language, path)
 
     if blog_delete_response.path == "*":
         logger.error("Blog has not been deleted")
         raise HTTPException(status_code=400, detail="operation_failed")
     else:
-        return MessageToDict(blog_delete_response,
-                             preserving_proto_field_name=True,
-                             always_print_fields_with_no_presence=True)
+        blog_search.remove(language, path)
+        return ProtoJSONResponse(blog_delete_response, always_print_fields_with_no_presence=True)
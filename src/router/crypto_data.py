@@ -1,20 +1,24 @@
 from csv import excel
 
-from google.protobuf.json_format import MessageToDict
 from fastapi import APIRouter, HTTPException, Request, Query
 from grpc import RpcError
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 from enum import Enum
 
-from src.connections import currency_stub
 from currency import currency_pb2, currency_type_pb2
-from src.connections import prices_stub
+from src.connections import aio
 from coins import coins_pb2
 from src.router.currency import get_currency_type
 
 from src.utils.logger import logger
 from src.utils.auth import verify_user
+from src.utils.coin_list_cache import coin_list_cache
+from src.utils.downsampling import MIN_POINTS, aggregate_candles, downsample_series
+from src.utils.etag import not_modified
+from src.utils.historical_cache import historical_data_cache, HistoricalDataError
+from src.utils.proto_json import ProtoJSONResponse, message_to_dict
+from src.utils.singleflight import singleflight
 
 crypto_router = APIRouter(tags=["Crypto data"])
 
@@ -78,7 +82,7 @@ crypto_router = APIRouter(tags=["Crypto data"])
         }
     }
 }, description='Returns details of cryptocurrency in fiat currency specified in params')
-def get_crypto_details(
+async def get_crypto_details(
         request: Request,
         coin_id: str = Query(..., description="Name of crypto for which data will be received"),
         currency: str = Query("usd", description="Currency code in which data will be received")):
@@ -89,9 +93,9 @@ def get_crypto_details(
         raise HTTPException(status_code=400,
                             detail="invalid_data")
 
-    currency_type = get_currency_type(currency)
+    currency_type = await get_currency_type(currency)
     currency_type = currency_type["currency_type"]
-    currency_crypto_type = get_currency_type(coin_id)
+    currency_crypto_type = await get_currency_type(coin_id)
     currency_crypto_type = currency_crypto_type["currency_type"]
 
     if currency_type != "FIAT" or currency_crypto_type != "CRYPTO" or \
@@ -103,7 +107,8 @@ def get_crypto_details(
     try:
         coin_details_message: coins_pb2.CoinDataRequest = coins_pb2.CoinDataRequest(coin_id=coin_id,
                                                                                     fiat_currency=currency)
-        response: coins_pb2.DataResponse = prices_stub.GetCoinData(coin_details_message)
+        response: coins_pb2.DataResponse = await singleflight.call(aio.prices_stub, "GetCoinData",
+                                                                   coin_details_message)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500,
@@ -111,11 +116,9 @@ def get_crypto_details(
 
     if response.status == "success":
         logger.info("Details for ", coin_id, " retrieved successfully")
-        endpoint_response = MessageToDict(response,
-                                          preserving_proto_field_name=True,
-                                          always_print_fields_with_no_presence=True)
+        endpoint_response = message_to_dict(response, always_print_fields_with_no_presence=True)
         endpoint_response["values_in_currency"] = currency
-        return endpoint_response
+        return ProtoJSONResponse(endpoint_response)
     else:
         logger.error("Coin details error: ", response.status, " with message: ", response.error_message)
         raise HTTPException(status_code=500,
@@ -223,13 +226,15 @@ def get_crypto_details(
         }
     }
 }, description='Returns historical data of cryptocurrency in fiat currency specified in params')
-def get_crypto_historical_data(
+async def get_crypto_historical_data(
         request: Request,
         coin_id: str = Query(..., description="Name of crypto for which data will be received"),
         currency: str = Query("usd", description="Currency code in which data will be received"),
         start_date: datetime = Query(datetime.now() - timedelta(days=1), description="Start date for historical data"),
         end_date: datetime = Query(datetime.now(), description="End date for historical data"),
         ohlc_data: bool = Query(False, description="Specifies if data should be in OHLC format"),
+        max_points: int = Query(None, description="Maximum number of points returned, longer series are "
+                                                  "downsampled (LTTB) or aggregated into wider candles"),
 ):
     auth_header = request.headers.get("Authorization")
     verify_user(auth_header)
@@ -238,9 +243,9 @@ def get_crypto_historical_data(
         raise HTTPException(status_code=400,
                             detail="invalid_data")
 
-    currency_type = get_currency_type(currency)
+    currency_type = await get_currency_type(currency)
     currency_type = currency_type["currency_type"]
-    currency_crypto_type = get_currency_type(coin_id)
+    currency_crypto_type = await get_currency_type(coin_id)
     currency_crypto_type = currency_crypto_type["currency_type"]
 
     if currency_type != "FIAT" or currency_crypto_type != "CRYPTO" or \
@@ -248,37 +253,33 @@ def get_crypto_historical_data(
             currency_crypto_type == "NOT_SUPPORTED" or \
             end_date < start_date or \
             start_date > datetime.today() or \
-            end_date > datetime.today():
+            end_date > datetime.today() or \
+            (max_points is not None and max_points < MIN_POINTS):
         raise HTTPException(status_code=400,
                             detail="invalid_data")
 
-    coin_details_message: coins_pb2.HistoricalDataRequest = coins_pb2.HistoricalDataRequest(coin_id=coin_id,
-                                                                                            fiat_currency=currency,
-                                                                                            start_date=start_date,
-                                                                                            end_date=end_date)
-
     try:
-        if ohlc_data:
-            response: coins_pb2.DataResponse = prices_stub.GetHistoricalCandleData(coin_details_message)
-        else:
-            response: coins_pb2.DataResponse = prices_stub.GetHistoricalData(coin_details_message)
+        data = await historical_data_cache.get(coin_id, currency, start_date, end_date, ohlc_data)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500,
                             detail="internal_server_error")
-
-    if response.status == "success":
-        logger.info("Details for ", coin_id, " retrieved successfully")
-        endpoint_response = MessageToDict(response,
-                                          preserving_proto_field_name=True,
-                                          always_print_fields_with_no_presence=True)
-        endpoint_response["values_in_currency"] = currency
-        return endpoint_response
-    else:
-        logger.error("Coin details error: ", response.status, " with message: ", response.error_message)
+    except HistoricalDataError as e:
+        logger.error("Coin details error: ", e.status, " with message: ", e.error_message)
         raise HTTPException(status_code=500,
                             detail="internal_server_error")
 
+    if max_points is not None:
+        data = aggregate_candles(data, max_points) if ohlc_data else downsample_series(data, max_points)
+
+    logger.info("Details for ", coin_id, " retrieved successfully")
+    return ProtoJSONResponse({
+        "status": "success",
+        "data": data,
+        "error_message": "",
+        "values_in_currency": currency
+    })
+
 
 @crypto_router.get("/coins", responses={
     500: {
@@ -355,13 +356,13 @@ def get_crypto_historical_data(
         }
     }
 }, description='Returns list of supported cryptocurrencies with most important details for display')
-def get_list_of_coins(request: Request,
-                      currency: str = Query('usd', description="Currency code in which data will be received")
-                      ):
+async def get_list_of_coins(request: Request,
+                            currency: str = Query('usd', description="Currency code in which data will be received")
+                            ):
     auth_header = request.headers.get("Authorization")
     verify_user(auth_header)
 
-    currency_type = get_currency_type(currency)
+    currency_type = await get_currency_type(currency)
     currency_type = currency_type["currency_type"]
 
     if currency_type != "FIAT":
@@ -370,22 +371,16 @@ def get_list_of_coins(request: Request,
                             detail="invalid_data")
 
     try:
-        coins_list_message: coins_pb2.ListDataForAllCoinsRequest = coins_pb2.ListDataForAllCoinsRequest(
-            fiat_currency=currency)
-        print(coins_list_message)
-
-        response: coins_pb2.ListDataForAllCoinsResponse = prices_stub.GetListDataForAllCoins(coins_list_message)
+        coin_list = await coin_list_cache.get(currency)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500,
                             detail="internal_server_error")
 
-    if response.status == "success" and len(response.data) != 0:
+    if coin_list is not None:
         logger.info("Fetched list of all available coins")
-        dict_data = MessageToDict(response,
-                                  preserving_proto_field_name=True,
-                                  always_print_fields_with_no_presence=True)
-        return {"coins": dict_data["data"]}
+        return not_modified(request, coin_list.etag) or await coin_list.body.response(
+            request, headers={"ETag": coin_list.etag})
     else:
         logger.warning("No coins available - consider error in communication")
         raise HTTPException(status_code=204)
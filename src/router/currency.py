@@ -1,11 +1,12 @@
-from google.protobuf.json_format import MessageToDict
 from fastapi import APIRouter, HTTPException, Request
 from grpc import RpcError
 from pydantic import BaseModel
 from enum import Enum
 
-from src.connections import currency_stub
 from currency import currency_pb2, currency_type_pb2
+from src.utils.currency_registry import currency_registry
+from src.utils.etag import not_modified
+from src.utils.proto_json import ProtoJSONResponse
 
 from src.utils.logger import logger
 
@@ -61,19 +62,18 @@ class CurrencyType(str, Enum):
         }
     }
 }, description='Returns type of given currency')
-def get_currency_type(currency_name: str):
-    currency_message = currency_pb2.CurrencyDetails(currency_name=currency_name)
+async def get_currency_type(currency_name: str):
     try:
-        currency_type_response: currency_pb2.CurrencyTypeMsg = currency_stub.GetCurrencyType(currency_message)
+        currency_type = await currency_registry.get_type(currency_name)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500,
                             detail="internal_server_error")
 
-    logger.info(f"Currency name: {currency_name}, currency_type: {currency_types_mapper[currency_type_response.type]}")
+    logger.info(f"Currency name: {currency_name}, currency_type: {currency_types_mapper[currency_type]}")
     endpoint_response = {
         "currency_name": currency_name,
-        "currency_type": currency_types_mapper[currency_type_response.type]
+        "currency_type": currency_types_mapper[currency_type]
     }
     return endpoint_response
 
@@ -119,20 +119,18 @@ def get_currency_type(currency_name: str):
                   }
               },
               description='Returns currencies of given type')
-def get_currencies_by_type(currency_type: CurrencyType):
-    type_message = currency_pb2.CurrencyTypeMsg(type=currency_type.to_grpc())
-
+async def get_currencies_by_type(currency_type: CurrencyType, request: Request):
     try:
-        currencies_list: currency_pb2.CurrencyList = currency_stub.GetSupportedCurrencies(type_message)
+        versioned_list = await currency_registry.get_currencies(currency_type.to_grpc())
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500,
                             detail="internal_server_error")
 
+    currencies_list: currency_pb2.CurrencyList = versioned_list.currencies
     if len(currencies_list.currencies) == 0:
         logger.info("No currencies found")
         raise HTTPException(status_code=204)
-    else:
-        return MessageToDict(currencies_list,
-                             preserving_proto_field_name=True,
-                             always_print_fields_with_no_presence=True)
+
+    return not_modified(request, versioned_list.etag) or ProtoJSONResponse(
+        currencies_list, headers={"ETag": versioned_list.etag}, always_print_fields_with_no_presence=True)
@@ -1,14 +1,18 @@
-from google.protobuf.json_format import MessageToDict
+import sqlite3
+
 from fastapi import APIRouter, HTTPException, Request
 from grpc import RpcError
 from pydantic import BaseModel
 from enum import Enum
 from typing import Optional
 
-from src.connections import order_stub, orders_service_order_stub
+from src.connections import aio
 from order import order_pb2, order_type_pb2, order_status_pb2, order_side_pb2
-from src.router.wallets import create_wallet, WalletCreationData
+from src.router.wallets import create_wallet_message, WalletCreationData
 from src.utils.auth import verify_user
+from src.utils.dual_write import DualWrite
+from src.utils.outbox import outbox
+from src.utils.proto_json import ProtoJSONResponse
 
 from src.utils.logger import logger
 from user import user_type_pb2
@@ -73,6 +77,11 @@ transaction_status_mapper = {
 order = APIRouter(tags=["Order"])
 
 
+async def delete_created_order(created_order: order_pb2.OrderDetails):
+    if created_order.id != "":
+        await aio.order_stub.DeleteOrder(order_pb2.OrderID(id=created_order.id))
+
+
 @order.post("/", responses={
     500: {
         "description": "Problems occurred inside the server",
@@ -125,7 +134,7 @@ order = APIRouter(tags=["Order"])
         }
     }
 }, description='Creates an order')
-def create_order(orderDetails: OrderDetails, request: Request):
+async def create_order(orderDetails: OrderDetails, request: Request):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
@@ -139,45 +148,48 @@ def create_order(orderDetails: OrderDetails, request: Request):
 
     crypto_wallet_request_data = WalletCreationData(currency=orderDetails.currency_target)
     try:
-        wallet_creation_response = create_wallet(wallet_data=crypto_wallet_request_data,
-                                                 request=request)
+        wallet_message = await create_wallet_message(crypto_wallet_request_data, jwt_payload)
     except HTTPException as e:
         logger.warning(f"Creation wallet error: {e}")
         raise e
 
-    orderRequest = order_pb2.OrderDetails(user_id=jwt_payload.get("id"),
-                                          status=order_status_pb2.ORDER_STATUS_PENDING,
-                                          fiat_wallet_id=orderDetails.currency_used_wallet_id if
-                                          order_side_order_details == order_side_pb2.ORDER_SIDE_BUY else
-                                          wallet_creation_response.get("id"),
-                                          crypto_wallet_id=wallet_creation_response.get("id") if
-                                          order_side_order_details == order_side_pb2.ORDER_SIDE_BUY else
-                                          orderDetails.currency_used_wallet_id,
-                                          nominal=orderDetails.nominal,
-                                          cash_quantity=orderDetails.cash_quantity if orderDetails.cash_quantity != "" else "0",
-                                          price=orderDetails.price,
-                                          type=order_type_order_details,
-                                          side=order_side_order_details
-                                          )
-
-    try:
-        response: order_pb2.OrderDetails = order_stub.CreateOrder(orderRequest)
-    except RpcError as e:
-        logger.error("gRPC error details:", e)
-        raise HTTPException(status_code=500, detail="internal_server_error")
-
     try:
-
-        response_orders_service: order_pb2.OrderDetails = orders_service_order_stub.CreateOrder(response)
+        async with DualWrite("create_order") as dual_write:
+            wallet = await dual_write.leg("db_manager_wallet", aio.wallet_stub.CreateWallet, wallet_message)
+            if wallet.id == "":
+                logger.warning("Creation wallet error: wallet was not created")
+                raise HTTPException(status_code=400, detail="operation_failed")
+
+            orderRequest = order_pb2.OrderDetails(user_id=jwt_payload.get("id"),
+                                                  status=order_status_pb2.ORDER_STATUS_PENDING,
+                                                  fiat_wallet_id=orderDetails.currency_used_wallet_id if
+                                                  order_side_order_details == order_side_pb2.ORDER_SIDE_BUY else
+                                                  wallet.id,
+                                                  crypto_wallet_id=wallet.id if
+                                                  order_side_order_details == order_side_pb2.ORDER_SIDE_BUY else
+                                                  orderDetails.currency_used_wallet_id,
+                                                  nominal=orderDetails.nominal,
+                                                  cash_quantity=orderDetails.cash_quantity if orderDetails.cash_quantity != "" else "0",
+                                                  price=orderDetails.price,
+                                                  type=order_type_order_details,
+                                                  side=order_side_order_details
+                                                  )
+
+            response: order_pb2.OrderDetails = await dual_write.leg(
+                "db_manager_order", aio.order_stub.CreateOrder, orderRequest, compensate=delete_created_order)
+
+            if response.id == "":
+                logger.warning("Placing order failed")
+                raise HTTPException(status_code=400, detail="operation_failed")
+
+            # Orders_Service is replicated in the background; failing to queue it undoes the order
+            await outbox.enqueue(response.user_id, ("CreateWallet", wallet), ("CreateOrder", response))
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
 
-    if response_orders_service.id != "":
-        logger.info(f"Order with id: {response.id} placed successfully")
-        return MessageToDict(response_orders_service, preserving_proto_field_name=True)
-    logger.warning("Placing order failed")
-    raise HTTPException(status_code=400, detail="operation_failed")
+    logger.info(f"Order with id: {response.id} placed successfully")
+    return ProtoJSONResponse(response)
 
 
 @order.get("/", responses={
@@ -232,14 +244,14 @@ def create_order(orderDetails: OrderDetails, request: Request):
         }
     }
 }, description='Returns an order for specified order_id')
-def get_order(order_id, request: Request):
+async def get_order(order_id, request: Request):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
     order_message = order_pb2.OrderID(id=order_id)
 
     try:
-        response: order_pb2.OrderDetails = order_stub.GetOrder(order_message)
+        response: order_pb2.OrderDetails = await aio.order_stub.GetOrder(order_message)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
@@ -253,7 +265,7 @@ def get_order(order_id, request: Request):
             logger.warning("Unauthorized user tried to fetch data")
             raise HTTPException(status_code=401, detail="unauthorized_user_for_method")
         logger.info("Fetched order")
-        return MessageToDict(response, preserving_proto_field_name=True)
+        return ProtoJSONResponse(response)
 
 
 @order.delete("/", responses={
@@ -308,8 +320,8 @@ def get_order(order_id, request: Request):
         }
     }
 }, description='Deletes an order of specified currency')
-def delete_order(order_id, request: Request):
-    order_details = get_order(order_id, request=request)
+async def delete_order(order_id, request: Request):
+    order_details = (await get_order(order_id, request=request)).content
     if order_details['status'] != "ORDER_STATUS_PENDING":
         logger.error("Order status not PENDING - somebody tried to delete it")
         raise HTTPException(status_code=400, detail="operation_failed")
@@ -317,9 +329,7 @@ def delete_order(order_id, request: Request):
     delete_order_message = order_pb2.OrderID(id=order_id)
 
     try:
-        response: order_pb2.OrderDetails = order_stub.DeleteOrder(delete_order_message)
-        orders_service_order_stub.DeleteOrder(response)
-
+        response: order_pb2.OrderDetails = await aio.order_stub.DeleteOrder(delete_order_message)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
@@ -327,9 +337,14 @@ def delete_order(order_id, request: Request):
     if response.id == "":
         logger.error(f"No order with provided id: {order_id}")
         raise HTTPException(status_code=400, detail="operation_failed")
-    else:
-        logger.info(f"Order with provided id: {order_id} deleted")
-        return MessageToDict(response, preserving_proto_field_name=True)
+
+    try:
+        await outbox.enqueue(response.user_id, ("DeleteOrder", response))
+    except sqlite3.Error as e:
+        # The order is already deleted in DB_Manager, so only Orders_Service misses it
+        logger.error(f"Failed to queue the deletion of order {order_id} for Orders_Service: {e}")
+    logger.info(f"Order with provided id: {order_id} deleted")
+    return ProtoJSONResponse(response)
 
 
 @order.get("/orders", responses={
@@ -400,12 +415,12 @@ def delete_order(order_id, request: Request):
         }
     }
 }, description='Returns orders which fit given filters')
-def get_orders(request: Request,
-               user_id: Optional[str] = None,
-               wallet_id: Optional[str] = "",
-               order_status: Optional[OrderStatus] = None,
-               order_type: Optional[OrderType] = None,
-               side: Optional[OrderSide] = None):
+async def get_orders(request: Request,
+                     user_id: Optional[str] = None,
+                     wallet_id: Optional[str] = "",
+                     order_status: Optional[OrderStatus] = None,
+                     order_type: Optional[OrderType] = None,
+                     side: Optional[OrderSide] = None):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
@@ -434,7 +449,7 @@ def get_orders(request: Request,
                                            type=mapped_type)
 
     try:
-        response: order_pb2.OrderList = order_stub.GetOrders(filter_message)
+        response: order_pb2.OrderList = await aio.order_stub.GetOrders(filter_message)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
@@ -444,4 +459,4 @@ def get_orders(request: Request,
         raise HTTPException(status_code=204)
     else:
         logger.info("Orders found")
-        return MessageToDict(response, preserving_proto_field_name=True)
+        return ProtoJSONResponse(response)
@@ -1,18 +1,20 @@
-from google.protobuf.json_format import MessageToDict
 from urllib.parse import urlparse
 from fastapi import APIRouter, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
 from grpc import RpcError
 from pydantic import BaseModel
 import stripe
 import json
 
 from secret import secret_pb2
-from src.connections import secret_stub, payment_stub
+from src.connections import secret_stub, aio
 from payment import payment_state_pb2, payment_pb2
 from src.utils.auth import verify_user
+from src.utils.proto_json import ProtoJSONResponse
 
 from src.utils.logger import logger
 from src.utils.payment_scheduler import get_session_status
+from src.utils.stripe_events import WEBHOOK_EVENTS, payment_update_for_event, stripe_events
 from user import user_type_pb2
 
 SUPPORTED_CURRENCIES = ['USD', 'EUR', 'GBP', 'PLN']
@@ -25,6 +27,14 @@ try:
 except RpcError as err:
     logger.error(f"Error retrieving secret: {err}")
 
+STRIPE_WEBHOOK_SECRET = ""
+try:
+    message = secret_pb2.SecretName(name="STRIPE_WEBHOOK_SECRET")
+    response_secret: secret_pb2.SecretValue = secret_stub.GetSecret(message)
+    STRIPE_WEBHOOK_SECRET = response_secret.value
+except RpcError as err:
+    logger.error(f"Error retrieving secret: {err}")
+
 
 class MakePayment(BaseModel):
     currency: str
@@ -85,7 +95,7 @@ payments = APIRouter(tags=["Payments"])
         }
     }
 }, description='Returns details about created payment and redirections')
-def payment(payment_details: MakePayment, request: Request):
+async def payment(payment_details: MakePayment, request: Request):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
@@ -110,7 +120,8 @@ def payment(payment_details: MakePayment, request: Request):
     logger.info(f'Parsed payment success: {success_url} & cancel: {cancel_url} URLs')
 
     try:
-        session = stripe.checkout.Session.create(
+        session = await run_in_threadpool(
+            stripe.checkout.Session.create,
             payment_method_types=['card'],
             line_items=[{
                 'price_data': {
@@ -135,19 +146,19 @@ def payment(payment_details: MakePayment, request: Request):
                                                                                  id=session.id,
                                                                                  user_id=jwt_payload['id'],
                                                                                  state=payment_state_pb2.PAYMENT_STATE_PENDING)
-        payment_details_response: payment_pb2.PaymentDetails = payment_stub.CreatePayment(payment_message)
+        payment_details_response: payment_pb2.PaymentDetails = await aio.payment_stub.CreatePayment(payment_message)
 
     except RpcError as e:
         logger.error("gRPC error details:", e)
-        stripe.checkout.Session.expire(session.id)
+        await run_in_threadpool(stripe.checkout.Session.expire, session.id)
         raise HTTPException(500, 'internal_server_error')
 
     response = [{
         "session_url": session.url,
-        "payment_details": MessageToDict(payment_details_response, preserving_proto_field_name=True)
+        "payment_details": payment_details_response
     }]
 
-    return response
+    return ProtoJSONResponse(response)
 
 
 @payments.get("/", responses={
@@ -199,14 +210,14 @@ def payment(payment_details: MakePayment, request: Request):
         }
     }
 }, description="Returns payment details of specified id")
-def get_payment_details(payment_id, request: Request):
+async def get_payment_details(payment_id, request: Request):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
     payment_id_message = payment_pb2.PaymentID(id=payment_id)
 
     try:
-        payment_details_response: payment_pb2.PaymentDetails = payment_stub.GetPayment(payment_id_message)
+        payment_details_response: payment_pb2.PaymentDetails = await aio.payment_stub.GetPayment(payment_id_message)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         return HTTPException(500, 'internal_server_error')
@@ -221,7 +232,7 @@ def get_payment_details(payment_id, request: Request):
         raise HTTPException(status_code=401, detail="unauthorized_user_for_method")
 
     logger.info(f"Fetched payment with id: {payment_details_response.id}")
-    return MessageToDict(payment_details_response, preserving_proto_field_name=True)
+    return ProtoJSONResponse(payment_details_response)
 
 
 @payments.get("/payments", responses={
@@ -284,8 +295,8 @@ def get_payment_details(payment_id, request: Request):
         }
     }
 }, description="Returns a list of all payments for user")
-def get_users_payments(request: Request,
-                       user_id: str = Query(None, description="ID of the user")):
+async def get_users_payments(request: Request,
+                             user_id: str = Query(None, description="ID of the user")):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
@@ -298,7 +309,7 @@ def get_users_payments(request: Request,
         raise HTTPException(401, detail="unauthorized_user_for_method")
 
     try:
-        response: payment_pb2.PaymentList = payment_stub.GetPayments(user_data)
+        response: payment_pb2.PaymentList = await aio.payment_stub.GetPayments(user_data)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(500, "internal_server_error")
@@ -308,7 +319,7 @@ def get_users_payments(request: Request,
         raise HTTPException(status_code=204)
     else:
         logger.info("Found payments")
-        return MessageToDict(response, preserving_proto_field_name=True)
+        return ProtoJSONResponse(response)
 
 
 @payments.put("/payment/cancel", responses={
@@ -352,15 +363,15 @@ def get_users_payments(request: Request,
         }
     }
 }, description="Cancels payment with specified id")
-def cancel_payment(payment_id, request: Request):
-    payment_status, session_status = get_session_status(payment_id)
+async def cancel_payment(payment_id, request: Request):
+    payment_status, session_status = await run_in_threadpool(get_session_status, payment_id)
 
     if session_status == "open":
         try:
-            stripe.checkout.Session.expire(payment_id)
+            await run_in_threadpool(stripe.checkout.Session.expire, payment_id)
             update_message: payment_pb2.PaymentDetails = payment_pb2.PaymentDetails(id=payment_id,
                                                                                     state=payment_state_pb2.PAYMENT_STATE_CANCELLED)
-            response: payment_pb2.PaymentDetails = payment_stub.UpdatePayment(update_message)
+            response: payment_pb2.PaymentDetails = await aio.payment_stub.UpdatePayment(update_message)
         except stripe.error.StripeError as e:
             logger.error(f"Stripe error occured: {e}")
             raise HTTPException(500, 'internal_server_error')
@@ -369,8 +380,72 @@ def cancel_payment(payment_id, request: Request):
             raise HTTPException(500, 'internal_server_error')
 
         logger.info(f"Payment with id {payment_id} cancelled")
-        return MessageToDict(response, preserving_proto_field_name=True)
+        return ProtoJSONResponse(response)
     else:
         logger.info(f"Payment with id {payment_id} was already cancelled or session expired")
-        payment_details = get_payment_details(payment_id, request)
+        payment_details = await get_payment_details(payment_id, request)
         return payment_details
+
+
+@payments.post("/webhook", responses={
+    500: {
+        "description": "Problems occurred inside the server, Stripe retries the event",
+        "content": {
+            "application/json": {
+                "example": {"detail": "internal_server_error"}
+            }
+        }
+    },
+    400: {
+        "description": "Event payload or signature is invalid",
+        "content": {
+            "application/json": {
+                "example": {"detail": "invalid_signature"}
+            }
+        }
+    },
+    200: {
+        "description": "Event received",
+        "content": {
+            "application/json": {
+                "example": {"received": True}
+            }
+        }
+    }
+}, description="Receives Stripe Checkout Session events and updates state of the payment")
+async def stripe_webhook(request: Request):
+    if STRIPE_WEBHOOK_SECRET == "":
+        logger.error("Stripe webhook secret is not configured")
+        raise HTTPException(500, 'internal_server_error')
+
+    payload = await request.body()
+    try:
+        event = stripe.Webhook.construct_event(payload, request.headers.get("Stripe-Signature", ""),
+                                               STRIPE_WEBHOOK_SECRET)
+    except (ValueError, stripe.error.SignatureVerificationError) as e:
+        logger.warning(f"Rejected Stripe webhook: {e}")
+        WEBHOOK_EVENTS.labels(type="unknown", result="rejected").inc()
+        raise HTTPException(400, 'invalid_signature')
+
+    update_message = payment_update_for_event(event)
+    if update_message is None:
+        WEBHOOK_EVENTS.labels(type=event.type, result="ignored").inc()
+        return {"received": True}
+
+    if not stripe_events.claim(event.id):
+        logger.info(f"Stripe event {event.id} already handled")
+        WEBHOOK_EVENTS.labels(type=event.type, result="duplicate").inc()
+        return {"received": True}
+
+    try:
+        response: payment_pb2.PaymentDetails = await aio.payment_stub.UpdatePayment(update_message)
+    except RpcError as e:
+        stripe_events.release(event.id)
+        WEBHOOK_EVENTS.labels(type=event.type, result="failed").inc()
+        logger.error("gRPC error details:", e)
+        raise HTTPException(500, 'internal_server_error')
+
+    stripe_events.complete(event.id)
+    WEBHOOK_EVENTS.labels(type=event.type, result="processed").inc()
+    logger.info(f"Payment {response.id} updated from Stripe event {event.id}")
+    return {"received": True}
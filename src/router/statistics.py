@@ -1,9 +1,9 @@
-from google.protobuf.json_format import MessageToDict
+import asyncio
+
 from fastapi import APIRouter, HTTPException, Request, Query
 from grpc import RpcError
 
-from src.connections import prices_stub
-from coins import coins_pb2
+from src.utils.price_snapshot import price_snapshot
 
 from src.utils.auth import verify_user
 from src.router.wallets import get_wallets, get_wallet_by_id
@@ -13,6 +13,16 @@ from src.utils.logger import logger
 statistics_router = APIRouter(tags=["Statistics"])
 
 
+async def get_coins_prices():
+    try:
+        snapshot = await price_snapshot.get()
+    except RpcError as e:
+        logger.error("gRPC error details:", e)
+        raise HTTPException(status_code=500, detail="internal_server_error")
+
+    return snapshot.prices
+
+
 @statistics_router.get(
     "/portfolio-diversity",
     responses={
@@ -83,24 +93,16 @@ async def get_portfolio_diversity(
         "usd", description="Currency in which prices will be calculated", max_length=3
     ),
 ):
-    list_of_wallets = get_wallets(request, user_id)
+    list_of_wallets, coins_prices = await asyncio.gather(
+        get_wallets(request, user_id), get_coins_prices()
+    )
     currency = currency.lower()
 
     crypto_wallets = []
-    for wallet in list_of_wallets["wallets"]:
+    for wallet in list_of_wallets.content["wallets"]:
         if wallet["is_crypto"]:
             crypto_wallets.append(wallet)
 
-    try:
-        coins_prices: coins_pb2.DataResponse = prices_stub.GetAllCoinsPrices(
-            coins_pb2.AllCoinsPricesRequest()
-        )
-    except RpcError as e:
-        logger.error("gRPC error details:", e)
-        raise HTTPException(status_code=500, detail="internal_server_error")
-
-    coins_prices = coins_prices.data
-
     sum_value = 0
     response = {
         "calculation_fiat_currency": currency,
@@ -195,24 +197,15 @@ async def get_crypto_estimation(
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
-    try:
-        coins_prices: coins_pb2.DataResponse = prices_stub.GetAllCoinsPrices(
-            coins_pb2.AllCoinsPricesRequest()
-        )
-    except RpcError as e:
-        logger.error("gRPC error details:", e)
-        raise HTTPException(status_code=500, detail="internal_server_error")
-    coins_prices = coins_prices.data
-
     response = {"calculation_fiat_currency": currency, "estimations": []}
 
     if wallet_id is None:
-        list_of_wallets = get_wallets(
-            request, user_id if user_id is not None else jwt_payload["id"]
+        list_of_wallets, coins_prices = await asyncio.gather(
+            get_wallets(request, user_id if user_id is not None else jwt_payload["id"]),
+            get_coins_prices(),
         )
-        list_of_wallets = list_of_wallets
 
-        for wallet in list_of_wallets["wallets"]:
+        for wallet in list_of_wallets.content["wallets"]:
             response["estimations"].append(
                 {
                     "cryptocurrency": wallet["currency"],
@@ -224,7 +217,10 @@ async def get_crypto_estimation(
 
         return response
     else:
-        wallet_details = get_wallet_by_id(wallet_id, request)
+        wallet_response, coins_prices = await asyncio.gather(
+            get_wallet_by_id(wallet_id, request), get_coins_prices()
+        )
+        wallet_details = wallet_response.content
         response["estimations"].append(
             {
                 "cryptocurrency": wallet_details["currency"],
@@ -1,12 +1,13 @@
+import asyncio
 from enum import Enum
 
 from fastapi import APIRouter, HTTPException, Request, Query
-from google.protobuf.json_format import MessageToDict
 from grpc import RpcError
 from pydantic import BaseModel
 
-from src.connections import user_stub
+from src.connections import aio
 from src.utils.auth import verify_user
+from src.utils.proto_json import ProtoJSONResponse
 from user import user_pb2, user_type_pb2
 
 from src.utils.logger import logger
@@ -95,13 +96,13 @@ class UserType(str, Enum):
     },
     description="Returns user details",
 )
-def get_user_details(request: Request):
+async def get_user_details(request: Request):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
     user_message = user_pb2.ReqGetUserDetails(id=jwt_payload.get("id"))
     try:
-        response: user_pb2.UserDetails = user_stub.GetUserDetails(user_message)
+        response: user_pb2.UserDetails = await aio.user_stub.GetUserDetails(user_message)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
@@ -111,11 +112,7 @@ def get_user_details(request: Request):
         raise HTTPException(status_code=204)
     else:
         logger.info("User's details found")
-        return MessageToDict(
-            response,
-            preserving_proto_field_name=True,
-            always_print_fields_with_no_presence=True,
-        )
+        return ProtoJSONResponse(response, always_print_fields_with_no_presence=True)
 
 
 @user.put(
@@ -168,7 +165,7 @@ def get_user_details(request: Request):
     },
     description="Updates user details of specified id",
 )
-def update_user_details(update_data: UpdateUserData, request: Request):
+async def update_user_details(update_data: UpdateUserData, request: Request):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
@@ -176,7 +173,7 @@ def update_user_details(update_data: UpdateUserData, request: Request):
         **update_data.model_dump(), id=jwt_payload.get("id")
     )
     try:
-        response: user_pb2.ResultResponse = user_stub.Update(user_message)
+        response: user_pb2.ResultResponse = await aio.user_stub.Update(user_message)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
@@ -186,11 +183,7 @@ def update_user_details(update_data: UpdateUserData, request: Request):
         raise HTTPException(status_code=400, detail="operation_failed")
     else:
         logger.info("Updating user details completed")
-        return MessageToDict(
-            user_message,
-            preserving_proto_field_name=True,
-            always_print_fields_with_no_presence=True,
-        )
+        return ProtoJSONResponse(user_message, always_print_fields_with_no_presence=True)
 
 
 @user.put(
@@ -235,18 +228,22 @@ def update_user_details(update_data: UpdateUserData, request: Request):
     },
     description="Updates password",
 )
-def update_password(updatePassword: UpdatePassword, request: Request):
+async def update_password(updatePassword: UpdatePassword, request: Request):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
+    old_password_hash, new_password_hash = await asyncio.gather(
+        hash_password(updatePassword.old_password),
+        hash_password(updatePassword.new_password),
+    )
     password_message: user_pb2.ChangePass = user_pb2.ChangePass(
         login=jwt_payload.get("email"),
-        old_password=hash_password(updatePassword.old_password),
-        new_password=hash_password(updatePassword.new_password),
+        old_password=old_password_hash,
+        new_password=new_password_hash,
     )
 
     try:
-        response: user_pb2.ResultResponse = user_stub.ChangePassword(password_message)
+        response: user_pb2.ResultResponse = await aio.user_stub.ChangePassword(password_message)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
@@ -256,11 +253,7 @@ def update_password(updatePassword: UpdatePassword, request: Request):
         raise HTTPException(status_code=400, detail="invalid_old_password")
 
     logger.info("Changing password completed")
-    return MessageToDict(
-        response,
-        preserving_proto_field_name=True,
-        always_print_fields_with_no_presence=True,
-    )
+    return ProtoJSONResponse(response, always_print_fields_with_no_presence=True)
 
 
 @user.delete(
@@ -296,8 +289,8 @@ def update_password(updatePassword: UpdatePassword, request: Request):
     },
     description="Deletes user",
 )
-def delete_user(request: Request,
-                user_id: str | None = Query("", description="ID of the user to delete"), ):
+async def delete_user(request: Request,
+                      user_id: str | None = Query("", description="ID of the user to delete"), ):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
@@ -322,7 +315,7 @@ def delete_user(request: Request,
 
 
     try:
-        response: user_pb2.ResultResponse = user_stub.Delete(user_message)
+        response: user_pb2.ResultResponse = await aio.user_stub.Delete(user_message)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
@@ -332,7 +325,7 @@ def delete_user(request: Request,
         raise HTTPException(status_code=400, detail="operation_failed")
     else:
         logger.info(f"User with id {user_id if user_id != "" else jwt_payload["id"]} deleted successfully")
-        return MessageToDict(response, preserving_proto_field_name=True)
+        return ProtoJSONResponse(response)
 
 
 @user.get(
@@ -379,7 +372,7 @@ def delete_user(request: Request,
     },
     description="Lists users for administrative purposes",
 )
-def list_users(request: Request):
+async def list_users(request: Request):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
@@ -388,7 +381,7 @@ def list_users(request: Request):
         raise HTTPException(401, detail="unauthorized_user_for_method")
 
     try:
-        response: user_pb2.UsersList = user_stub.GetAllUsers(user_pb2.AllUsersRequest())
+        response: user_pb2.UsersList = await aio.user_stub.GetAllUsers(user_pb2.AllUsersRequest())
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
@@ -397,11 +390,7 @@ def list_users(request: Request):
         logger.info("No users found")
         raise HTTPException(status_code=204)
     else:
-        return MessageToDict(
-            response,
-            preserving_proto_field_name=True,
-            always_print_fields_with_no_presence=True,
-        )
+        return ProtoJSONResponse(response, always_print_fields_with_no_presence=True)
 
 
 @user.put(
@@ -437,7 +426,7 @@ def list_users(request: Request):
     },
     description="Provides managing users' types for administrative purposes. User type can be change only by administrator user.",
 )
-def change_user_type(
+async def change_user_type(
         request: Request,
         new_user_type: UserType,
         user_id: str = Query(description="User ID whose type will be changed."),
@@ -453,7 +442,7 @@ def change_user_type(
         user_pb2.ReqGetUserDetails(id=user_id)
     )
     try:
-        issued_user_details: user_pb2.UserDetails = user_stub.GetUserDetails(
+        issued_user_details: user_pb2.UserDetails = await aio.user_stub.GetUserDetails(
             issued_user_details_message
         )
     except RpcError as e:
@@ -471,13 +460,9 @@ def change_user_type(
             id=user_id, user_type=new_user_type.to_grpc()
         )
         try:
-            update_response: user_pb2.UserDetails = user_stub.Update(update_message)
+            update_response: user_pb2.UserDetails = await aio.user_stub.Update(update_message)
         except RpcError as e:
             logger.error("gRPC error details:", e)
             raise HTTPException(status_code=500, detail="internal_server_error")
 
-        return MessageToDict(
-            update_response,
-            preserving_proto_field_name=True,
-            always_print_fields_with_no_presence=True,
-        )
+        return ProtoJSONResponse(update_response, always_print_fields_with_no_presence=True)
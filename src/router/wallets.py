@@ -1,13 +1,16 @@
-from google.protobuf.json_format import MessageToDict
+import sqlite3
+
 from fastapi import APIRouter, HTTPException, Request, Query
 from grpc import RpcError
 from pydantic import BaseModel
 
-from src.connections import wallet_stub, orders_service_wallet_stub
+from src.connections import aio
 from src.router.currency import get_currency_type
 from user import user_type_pb2
 from wallet import wallet_pb2
 from src.utils.auth import verify_user
+from src.utils.outbox import outbox
+from src.utils.proto_json import ProtoJSONResponse
 
 from src.utils.logger import logger
 
@@ -37,6 +40,22 @@ def is_crypto_func(currency_type):
         return True
 
 
+async def create_wallet_message(wallet_data: WalletCreationData, jwt_payload: dict) -> wallet_pb2.Wallet:
+    wallet_value = float(wallet_data.value)
+
+    currency_type_info = await get_currency_type(wallet_data.currency)
+    is_crypto = is_crypto_func(currency_type_info["currency_type"])
+
+    if (is_crypto and wallet_value > 0) and jwt_payload["user_type"] < user_type_pb2.USER_TYPE_SUPER_ADMIN_USER:
+        logger.warning("User tried to create crypto wallet with value > 0")
+        raise HTTPException(400, detail = "operation_failed")
+
+    if is_crypto is None:
+        raise HTTPException(400, detail="currency_type_not_supported")
+
+    return wallet_pb2.Wallet(**wallet_data.model_dump(), user_id=jwt_payload.get("id"), is_crypto=is_crypto)
+
+
 wallets = APIRouter(tags=["Wallets"])
 
 
@@ -89,7 +108,7 @@ wallets = APIRouter(tags=["Wallets"])
         }
     }
 }, description='Returns details about created or existing wallet')
-def create_wallet(wallet_data: WalletCreationData, request: Request):
+async def create_wallet(wallet_data: WalletCreationData, request: Request):
     wallet_value = float(wallet_data.value)
     if wallet_value < 0:
         raise HTTPException(400, detail="negative_value")
@@ -97,33 +116,18 @@ def create_wallet(wallet_data: WalletCreationData, request: Request):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
-    currency_type_info = get_currency_type(wallet_data.currency)
-    is_crypto = is_crypto_func(currency_type_info["currency_type"])
-
-    if (is_crypto and wallet_value > 0) and jwt_payload["user_type"] < user_type_pb2.USER_TYPE_SUPER_ADMIN_USER:
-        logger.warning("User tried to create crypto wallet with value > 0")
-        raise HTTPException(400, detail = "operation_failed")
-
-    if is_crypto is None:
-        raise HTTPException(400, detail="currency_type_not_supported")
-
-    wallet_message = wallet_pb2.Wallet(**wallet_data.model_dump(), user_id=jwt_payload.get("id"), is_crypto=is_crypto)
+    wallet_message = await create_wallet_message(wallet_data, jwt_payload)
 
     try:
-        response:wallet_pb2.Wallet = wallet_stub.CreateWallet(wallet_message)
+        response: wallet_pb2.Wallet = await aio.wallet_stub.CreateWallet(wallet_message)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
 
     if response.id != "":
-        try:
-            orders_service_wallet_stub.CreateWallet(response)
-        except RpcError as e:
-            logger.error("gRPC error details:", e)
-            raise HTTPException(status_code=500, detail="internal_server_error")
-
+        await outbox.enqueue(response.user_id, ("CreateWallet", response))
         logger.info("Creating wallet successfully performed")
-        return MessageToDict(response, preserving_proto_field_name=True, always_print_fields_with_no_presence=True)
+        return ProtoJSONResponse(response, always_print_fields_with_no_presence=True)
 
 
 
@@ -178,8 +182,8 @@ def create_wallet(wallet_data: WalletCreationData, request: Request):
         }
     }
 }, description="Update of wallet. Fields id and value are obligatory.")
-def update_wallet(update_wallet_data: WalletUpdateData, request: Request):
-    current_wallet_value = get_wallet_by_id(update_wallet_data.id, request)
+async def update_wallet(update_wallet_data: WalletUpdateData, request: Request):
+    current_wallet_value = (await get_wallet_by_id(update_wallet_data.id, request)).content
     wallet_value = float(current_wallet_value["value"])
 
     if float(update_wallet_data.value) < 0:
@@ -190,17 +194,22 @@ def update_wallet(update_wallet_data: WalletUpdateData, request: Request):
     data_for_update = wallet_pb2.Wallet(**update_wallet_data.model_dump())
 
     try:
-        response: wallet_pb2.Wallet = wallet_stub.UpdateWallet(data_for_update)
-        orders_service_wallet_stub.UpdateWallet(response)
+        response: wallet_pb2.Wallet = await aio.wallet_stub.UpdateWallet(data_for_update)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
 
-    if response.id != "":
-        logger.info("Updated wallet")
-        return MessageToDict(response, preserving_proto_field_name=True, always_print_fields_with_no_presence=True)
-    logger.info("Failed to update wallet")
-    raise HTTPException(status_code=400, detail="operation_failed")
+    if response.id == "":
+        logger.info("Failed to update wallet")
+        raise HTTPException(status_code=400, detail="operation_failed")
+
+    try:
+        await outbox.enqueue(response.user_id, ("UpdateWallet", response))
+    except sqlite3.Error as e:
+        # The wallet is already updated in DB_Manager, so only Orders_Service misses it
+        logger.error(f"Failed to queue the update of wallet {response.id} for Orders_Service: {e}")
+    logger.info("Updated wallet")
+    return ProtoJSONResponse(response, always_print_fields_with_no_presence=True)
 
 
 @wallets.get("/", responses={
@@ -263,8 +272,8 @@ def update_wallet(update_wallet_data: WalletUpdateData, request: Request):
         }
     }
 }, description="Returns a list of all wallets which belong to user")
-def get_wallets(request: Request,
-                user_id: str = Query(None, description="ID of the user")):
+async def get_wallets(request: Request,
+                      user_id: str = Query(None, description="ID of the user")):
     auth_header = request.headers.get("Authorization")
     jwt_payload = verify_user(auth_header)
 
@@ -277,7 +286,7 @@ def get_wallets(request: Request,
         raise HTTPException(401, detail="unauthorized_user_for_method")
 
     try:
-        response: wallet_pb2.WalletList = wallet_stub.GetUsersWallets(user_data)
+        response: wallet_pb2.WalletList = await aio.wallet_stub.GetUsersWallets(user_data)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
@@ -287,7 +296,7 @@ def get_wallets(request: Request,
         raise HTTPException(status_code=204)
     else:
         logger.info("Found wallets")
-        return MessageToDict(response, preserving_proto_field_name=True, always_print_fields_with_no_presence=True)
+        return ProtoJSONResponse(response, always_print_fields_with_no_presence=True)
 
 
 @wallets.get("/wallet", responses={
@@ -340,7 +349,7 @@ def get_wallets(request: Request,
         }
     }
 }, description="Returns wallet details of specified id")
-def get_wallet_by_id(wallet_id, request: Request):
+async def get_wallet_by_id(wallet_id, request: Request):
     if wallet_id is None or int(wallet_id) <= 0:
         raise HTTPException(status_code=400, detail="wallet_id_incorrect_value")
 
@@ -350,7 +359,7 @@ def get_wallet_by_id(wallet_id, request: Request):
     wallet_data = wallet_pb2.Wallet(id=wallet_id)
 
     try:
-        response: wallet_pb2.Wallet = wallet_stub.GetWallet(wallet_data)
+        response: wallet_pb2.Wallet = await aio.wallet_stub.GetWallet(wallet_data)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
@@ -364,7 +373,7 @@ def get_wallet_by_id(wallet_id, request: Request):
         logger.warning("Unauthorized user tried to fetch wallet details")
         raise HTTPException(status_code=401, detail="unauthorized_user_for_method")
     logger.info(f"Fetched wallet with id: {wallet_id}")
-    return MessageToDict(response, preserving_proto_field_name=True, always_print_fields_with_no_presence=True)
+    return ProtoJSONResponse(response, always_print_fields_with_no_presence=True)
 
 
 @wallets.delete("/", responses={
@@ -418,19 +427,19 @@ def get_wallet_by_id(wallet_id, request: Request):
         }
     }
 }, description="Deletes wallet of specified id")
-def delete_wallet(wallet_id, request: Request):
+async def delete_wallet(wallet_id, request: Request):
     if int(wallet_id) <= 0:
         raise HTTPException(status_code=400, detail="wallet_id_incorrect_value")
 
     try:
-        wallet_data = get_wallet_by_id(wallet_id=wallet_id, request=request)
+        wallet_data = (await get_wallet_by_id(wallet_id=wallet_id, request=request)).content
     except HTTPException as e:
         logger.warning(f"Problems with fetching wallet: {e}")
         raise e
 
     try:
         wallet_id_message = wallet_pb2.Wallet(id=wallet_data.get("id"))
-        response: wallet_pb2.Wallet = wallet_stub.DeleteWallet(wallet_id_message)
+        response: wallet_pb2.Wallet = await aio.wallet_stub.DeleteWallet(wallet_id_message)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
@@ -439,4 +448,4 @@ def delete_wallet(wallet_id, request: Request):
         logger.warning(f"Deleting wallet failed")
         raise HTTPException(status_code=204)
     logger.info(f"Deleted wallet: {wallet_id}")
-    return MessageToDict(response, preserving_proto_field_name=True, always_print_fields_with_no_presence=True)
+    return ProtoJSONResponse(response, always_print_fields_with_no_presence=True)
@@ -4,6 +4,7 @@ from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
 from opentelemetry.sdk.resources import SERVICE_NAME, Resource
 import src.utils.OpenTelemetry.config as Config
+from src.utils.OpenTelemetry.sampling import TailSamplingSpanProcessor, create_sampler
 
 
 # OpenTelemetry
@@ -12,16 +13,27 @@ trace_resource = Resource.create(
         SERVICE_NAME: Config.SERVICE_NAME,
     }
 )
-trace.set_tracer_provider(TracerProvider(resource=trace_resource))
+trace.set_tracer_provider(TracerProvider(
+    resource=trace_resource,
+    sampler=create_sampler(Config.TRACE_SAMPLE_RATIO, Config.TRACE_TAIL_SAMPLING),
+))
 
 # OTLP Exporter
 # if Config.USE_TEMPO:
 otlp_exporter: OTLPSpanExporter = OTLPSpanExporter(
     endpoint=f"http://{Config.TEMPO_HOSTNAME}:{Config.TEMPO_PORT}", insecure="true"
 )
-span_processor: BatchSpanProcessor = BatchSpanProcessor(otlp_exporter)
+span_processor: BatchSpanProcessor = BatchSpanProcessor(
+    otlp_exporter,
+    max_queue_size=Config.SPAN_QUEUE_SIZE,
+    schedule_delay_millis=Config.SPAN_SCHEDULE_DELAY_MS,
+    max_export_batch_size=Config.SPAN_BATCH_SIZE,
+    export_timeout_millis=Config.SPAN_EXPORT_TIMEOUT_MS,
+)
 tracer_provider: TracerProvider = trace.get_tracer_provider()
-tracer_provider.add_span_processor(span_processor)
+tracer_provider.add_span_processor(TailSamplingSpanProcessor(
+    span_processor, Config.TRACE_TAIL_SLOW_MS, Config.TRACE_TAIL_MAX_TRACES
+))
 
 
 def get_trace_id() -> str:
@@ -72,3 +84,16 @@ def set_current_span_status(errors: bool | set[bool] = None):
     elif isinstance(errors, set):
         if True not in errors:
             current_span.set_status(status=trace.StatusCode(1))
+
+
+def get_exemplar(span_context: trace.SpanContext | None, failed: bool, duration: float) -> dict[str, str] | None:
+    """
+    Exemplar labels linking a metric sample to the trace of span_context, if that trace reaches Tempo: it was
+    sampled up front, or tail sampling keeps it as failed or slow.
+    """
+    if span_context is None or not span_context.is_valid:
+        return None
+
+    exported = span_context.trace_flags.sampled or (
+        Config.TRACE_TAIL_SAMPLING and (failed or duration * 1000 >= Config.TRACE_TAIL_SLOW_MS))
+    return {"trace_id": "{trace:032x}".format(trace=span_context.trace_id)} if exported else None
@@ -8,3 +8,14 @@ SERVICE_NAME = "Frontend_API"
 
 TEMPO_HOSTNAME = os.getenv("TEMPO_HOSTNAME", "Tempo")
 TEMPO_PORT = os.getenv("TEMPO_PORT", "4317")
+
+# Share of new traces exported; with tail sampling, failed and slow traces are exported regardless
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "0.1"))
+TRACE_TAIL_SAMPLING = os.getenv("TRACE_TAIL_SAMPLING", "true").lower() == "true"
+TRACE_TAIL_SLOW_MS = float(os.getenv("TRACE_TAIL_SLOW_MS", "1000"))
+TRACE_TAIL_MAX_TRACES = int(os.getenv("TRACE_TAIL_MAX_TRACES", "2048"))
+
+SPAN_QUEUE_SIZE = int(os.getenv("SPAN_QUEUE_SIZE", "2048"))
+SPAN_BATCH_SIZE = int(os.getenv("SPAN_BATCH_SIZE", "512"))
+SPAN_SCHEDULE_DELAY_MS = int(os.getenv("SPAN_SCHEDULE_DELAY_MS", "5000"))
+SPAN_EXPORT_TIMEOUT_MS = int(os.getenv("SPAN_EXPORT_TIMEOUT_MS", "30000"))
@@ -0,0 +1,150 @@
+import threading
+from collections import OrderedDict, deque
+from typing import Optional, Sequence
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import (Decision, ParentBased, Sampler, SamplingResult,
+                                              TraceIdRatioBased)
+from opentelemetry.trace import Link, SpanContext, SpanKind, StatusCode, TraceFlags
+from opentelemetry.trace.span import TraceState
+from opentelemetry.util.types import Attributes
+from prometheus_client import Counter
+
+DROPPED_SPANS = Counter("otel_spans_dropped_total", "Finished spans that were never exported", ["reason"])
+TRACE_DECISIONS = Counter("otel_trace_sampling_decisions_total", "Locally finished traces by sampling decision",
+                          ["decision"])
+
+
+class RecordOnlySampler(Sampler):
+    """
+    Turns the DROP decisions of the wrapped sampler into RECORD_ONLY, so the span is still recorded for the
+    tail decision but is not marked sampled.
+    """
+
+    def __init__(self, sampler: Sampler | None = None):
+        self._sampler = sampler
+
+    def should_sample(self,
+                      parent_context: Optional[Context],
+                      trace_id: int,
+                      name: str,
+                      kind: SpanKind | None = None,
+                      attributes: Attributes = None,
+                      links: Sequence[Link] | None = None,
+                      trace_state: TraceState | None = None) -> SamplingResult:
+        if self._sampler is not None:
+            result = self._sampler.should_sample(parent_context, trace_id, name, kind, attributes, links,
+                                                 trace_state)
+            if result.decision != Decision.DROP:
+                return result
+        return SamplingResult(Decision.RECORD_ONLY, attributes, trace_state)
+
+    def get_description(self) -> str:
+        inner = self._sampler.get_description() if self._sampler is not None else "AlwaysOff"
+        return f"RecordOnly{{{inner}}}"
+
+
+def create_sampler(ratio: float, tail_sampling: bool) -> Sampler:
+    """
+    Samples ratio of new traces and follows the decision of the parent span otherwise. With tail_sampling, traces
+    that lose the head decision are recorded anyway, so TailSamplingSpanProcessor can still keep them.
+    """
+    if not tail_sampling:
+        return ParentBased(TraceIdRatioBased(ratio))
+    return ParentBased(RecordOnlySampler(TraceIdRatioBased(ratio)),
+                       remote_parent_not_sampled=RecordOnlySampler(),
+                       local_parent_not_sampled=RecordOnlySampler())
+
+
+def sampled_copy(span: ReadableSpan) -> ReadableSpan:
+    context = span.context
+    return ReadableSpan(
+        name=span.name,
+        context=SpanContext(context.trace_id, context.span_id, context.is_remote,
+                            TraceFlags(context.trace_flags | TraceFlags.SAMPLED), context.trace_state),
+        parent=span.parent,
+        resource=span.resource,
+        attributes=span.attributes,
+        events=span.events,
+        links=span.links,
+        kind=span.kind,
+        status=span.status,
+        start_time=span.start_time,
+        end_time=span.end_time,
+        instrumentation_scope=span.instrumentation_scope,
+    )
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    Passes sampled spans to the batch processor and buffers recorded but unsampled spans per trace until the local
+    root span ends. The trace is then exported anyway if any of its spans failed or the root took at least
+    slow_threshold_ms, and discarded otherwise.
+
+    At most max_traces undecided traces are buffered; the oldest is discarded to make room. Spans ending after
+    their local root (detached background tasks) start a new buffer and are discarded with it.
+    """
+
+    def __init__(self, processor: BatchSpanProcessor, slow_threshold_ms: float, max_traces: int):
+        self.processor = processor
+        self.slow_threshold_ns = int(slow_threshold_ms * 1_000_000)
+        self.max_traces = max_traces
+        self._traces: OrderedDict[int, list[ReadableSpan]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Internal to BatchSpanProcessor (opentelemetry-sdk 1.29, pinned in requirements.txt); if a later release
+        # moves it, the processor still works but queue drops are no longer counted
+        queue = getattr(processor, "queue", None)
+        self._export_queue: deque | None = queue if isinstance(queue, deque) and queue.maxlen else None
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None):
+        self.processor.on_start(span, parent_context)
+
+    def on_end(self, span: ReadableSpan):
+        if span.context.trace_flags.sampled:
+            self._export(span)
+            if is_local_root(span):
+                TRACE_DECISIONS.labels(decision="head").inc()
+            return
+
+        trace_id = span.context.trace_id
+        with self._lock:
+            spans = self._traces.get(trace_id)
+            if spans is None:
+                spans = self._traces[trace_id] = []
+                if len(self._traces) > self.max_traces:
+                    _, evicted = self._traces.popitem(last=False)
+                    DROPPED_SPANS.labels(reason="tail_buffer_full").inc(len(evicted))
+            spans.append(span)
+            if not is_local_root(span):
+                return
+            del self._traces[trace_id]
+
+        if any(buffered.status.status_code == StatusCode.ERROR for buffered in spans):
+            decision = "error"
+        elif span.end_time - span.start_time >= self.slow_threshold_ns:
+            decision = "slow"
+        else:
+            TRACE_DECISIONS.labels(decision="drop").inc()
+            return
+
+        TRACE_DECISIONS.labels(decision=decision).inc()
+        for buffered in spans:
+            self._export(sampled_copy(buffered))
+
+    def shutdown(self):
+        self.processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.processor.force_flush(timeout_millis)
+
+    def _export(self, span: ReadableSpan):
+        # The batch queue is a bounded deque: appending to a full one silently pushes out the oldest span
+        if self._export_queue is not None and len(self._export_queue) >= self._export_queue.maxlen:
+            DROPPED_SPANS.labels(reason="export_queue_full").inc()
+        self.processor.on_end(span)
+
+
+def is_local_root(span: ReadableSpan) -> bool:
+    return span.parent is None or span.parent.is_remote
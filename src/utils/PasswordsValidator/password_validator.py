@@ -1,24 +1,87 @@
+import asyncio
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
 from fastapi import HTTPException
-from argon2 import PasswordHasher
 from grpc import RpcError
+from prometheus_client import Counter, Gauge
 from src.utils.logger import logger
-from src.connections import password_stub
+from src.connections import aio
+from src.utils import PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_LIMIT
 from password import password_pb2
 from src.utils.auth import JWT_SECRET_KEY
+from src.utils.server_timing import measure
+from src import password_hash_worker
+
+HASH_QUEUE_DEPTH = Gauge("password_hash_queue_depth", "Password hashes queued or running in the process pool")
+HASH_REJECTIONS = Counter("password_hash_rejections_total", "Password hashes rejected because the queue was full")
+HASH_POOL_RESTARTS = Counter("password_hash_pool_restarts_total", "Hash process pools replaced after a worker died")
+
+def create_hash_executor() -> ProcessPoolExecutor:
+    # Workers start from the forkserver instead of forking this process, whose gRPC channels and logging,
+    # exporter and metrics threads must not be forked. The forkserver preloads only the worker module, and the
+    # workers ignore SIGINT, which the server handles.
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([password_hash_worker.__name__])
+    return ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, mp_context=context,
+                               initializer=signal.signal, initargs=(signal.SIGINT, signal.SIG_IGN))
+
+
+hash_executor = create_hash_executor()
+hash_queue_depth = 0
+
+
+async def argon2_hash(password: str, salt: str) -> str:
+    global hash_executor
+    executor = hash_executor
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, password_hash_worker.argon2_hash,
+                                                                password, salt)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM killed), which breaks the whole pool for good
+        if hash_executor is executor:
+            logger.error("Password hashing pool broke, starting a new one")
+            HASH_POOL_RESTARTS.inc()
+            executor.shutdown(wait=False, cancel_futures=True)
+            hash_executor = create_hash_executor()
+        return await asyncio.get_running_loop().run_in_executor(hash_executor, password_hash_worker.argon2_hash,
+                                                                password, salt)
+
+
+async def start_hash_workers():
+    await argon2_hash("", JWT_SECRET_KEY)
+
 
+def stop_hash_workers():
+    hash_executor.shutdown(wait=True, cancel_futures=True)
 
-def hash_password(password):
-    ph = PasswordHasher()
-    return ph.hash(password, salt=bytes(JWT_SECRET_KEY, 'utf-8'))
+
+async def hash_password(password):
+    global hash_queue_depth
+    if hash_queue_depth >= PASSWORD_HASH_QUEUE_LIMIT:
+        HASH_REJECTIONS.inc()
+        logger.warning("Password hashing queue is full")
+        raise HTTPException(status_code=503, detail="server_busy")
+
+    hash_queue_depth += 1
+    HASH_QUEUE_DEPTH.inc()
+    try:
+        with measure("hash"):
+            return await argon2_hash(password, JWT_SECRET_KEY)
+    finally:
+        hash_queue_depth -= 1
+        HASH_QUEUE_DEPTH.dec()
 
 
-def validate_password(password: str) -> bool:
+async def validate_password(password: str) -> bool:
     if len(password) < 12:
         raise ValueError("password_length_too_short")
 
     common_password_message: password_pb2.PasswordMessage = password_pb2.PasswordMessage(password=password)
     try:
-        isCommonPassword: password_pb2.CheckResponse = password_stub.CheckPassword(common_password_message)
+        isCommonPassword: password_pb2.CheckResponse = await aio.password_stub.CheckPassword(common_password_message)
     except RpcError as e:
         logger.error("gRPC error details:", e)
         raise HTTPException(status_code=500, detail="internal_server_error")
@@ -15,5 +15,54 @@ try:
     ORDERS_SERVICE_PORT = getenv("ORDERS_SERVICE_PORT", default="50054")
     ORDERS_SERVICE = getenv("ORDERS_SERVICE", default="127.0.0.1")
 
+    PRICE_SNAPSHOT_REFRESH_SECONDS = float(getenv("PRICE_SNAPSHOT_REFRESH_SECONDS", default="5"))
+    PRICE_SNAPSHOT_MAX_STALE_SECONDS = float(getenv("PRICE_SNAPSHOT_MAX_STALE_SECONDS", default="60"))
+
+    CURRENCY_REGISTRY_REFRESH_SECONDS = float(getenv("CURRENCY_REGISTRY_REFRESH_SECONDS", default="3600"))
+    CURRENCY_NEGATIVE_TTL_SECONDS = float(getenv("CURRENCY_NEGATIVE_TTL_SECONDS", default="300"))
+
+    JWT_CACHE_MAX_SIZE = int(getenv("JWT_CACHE_MAX_SIZE", default="10000"))
+
+    PASSWORD_HASH_WORKERS = int(getenv("PASSWORD_HASH_WORKERS", default="2"))
+    PASSWORD_HASH_QUEUE_LIMIT = int(getenv("PASSWORD_HASH_QUEUE_LIMIT", default="32"))
+
+    HISTORICAL_CACHE_MAX_POINTS = int(getenv("HISTORICAL_CACHE_MAX_POINTS", default="500000"))
+
+    OUTBOX_PATH = getenv("OUTBOX_PATH", default="outbox.sqlite3")
+    OUTBOX_BATCH_SIZE = int(getenv("OUTBOX_BATCH_SIZE", default="100"))
+    OUTBOX_MAX_ATTEMPTS = int(getenv("OUTBOX_MAX_ATTEMPTS", default="20"))
+    OUTBOX_POLL_SECONDS = float(getenv("OUTBOX_POLL_SECONDS", default="1"))
+    # How long a process owns the messages it claimed; another process re-sends them once it expires
+    OUTBOX_LEASE_SECONDS = float(getenv("OUTBOX_LEASE_SECONDS", default="300"))
+
+    PAYMENT_POLL_WORKERS = int(getenv("PAYMENT_POLL_WORKERS", default="16"))
+    PAYMENT_RECONCILE_SECONDS = float(getenv("PAYMENT_RECONCILE_SECONDS", default="15"))
+    PAYMENT_CHECK_MIN_SECONDS = float(getenv("PAYMENT_CHECK_MIN_SECONDS", default="30"))
+    PAYMENT_CHECK_MAX_SECONDS = float(getenv("PAYMENT_CHECK_MAX_SECONDS", default="3600"))
+
+    BLOG_CACHE_MAX_BYTES = int(getenv("BLOG_CACHE_MAX_BYTES", default=str(16 * 1024 * 1024)))
+    BLOG_CACHE_TTL_SECONDS = float(getenv("BLOG_CACHE_TTL_SECONDS", default="300"))
+    BLOG_CACHE_MAX_STALE_SECONDS = float(getenv("BLOG_CACHE_MAX_STALE_SECONDS", default="3600"))
+    BLOG_SEARCH_REFRESH_SECONDS = float(getenv("BLOG_SEARCH_REFRESH_SECONDS", default="600"))
+    BLOG_SEARCH_MAX_POSTINGS = int(getenv("BLOG_SEARCH_MAX_POSTINGS", default="10000"))
+    # GetBlogs has no paging and the search index fetches every post with it
+    BLOG_SEARCH_MAX_MESSAGE_BYTES = int(getenv("BLOG_SEARCH_MAX_MESSAGE_BYTES", default=str(256 * 1024 * 1024)))
+    PAYMENT_SCHEDULER_LOCK_PATH = getenv("PAYMENT_SCHEDULER_LOCK_PATH", default="payment_scheduler.lock")
+    PAYMENT_SCHEDULER_ELECTION_SECONDS = float(getenv("PAYMENT_SCHEDULER_ELECTION_SECONDS", default="10"))
+    STRIPE_EVENT_CACHE_SIZE = int(getenv("STRIPE_EVENT_CACHE_SIZE", default="10000"))
+
+    COMPRESSION_MIN_BYTES = int(getenv("COMPRESSION_MIN_BYTES", default="1024"))
+    COIN_LIST_TTL_SECONDS = float(getenv("COIN_LIST_TTL_SECONDS", default="30"))
+
+    # Sends Server-Timing to every client instead of super admins only
+    SERVER_TIMING_ENABLED = getenv("SERVER_TIMING_ENABLED", default="false").lower() == "true"
+
+    # Time a request may spend on backend calls, by route template, e.g. "/api/crypto/historical-data=20,..."
+    DEADLINE_DEFAULT_SECONDS = float(getenv("DEADLINE_DEFAULT_SECONDS", default="10"))
+    DEADLINE_ROUTE_SECONDS = {route.strip(): float(seconds) for route, _, seconds in
+                              (item.partition("=") for item in getenv("DEADLINE_ROUTE_SECONDS", default="").split(","))
+                              if route.strip()}
+    RPC_TIMEOUT_SECONDS = float(getenv("RPC_TIMEOUT_SECONDS", default="5"))
+
 except Exception as e:
     logger.error(f"Error occured when loading environment variables: {e}")
@@ -1,10 +1,18 @@
+import hashlib
+import time
+from collections import OrderedDict
+
 import jwt
 from datetime import datetime, timedelta, UTC
 from grpc import RpcError
 from fastapi import HTTPException
+from prometheus_client import Counter
 
 from src.connections import secret_stub
+from src.utils import JWT_CACHE_MAX_SIZE
+from src.utils.server_timing import measure
 from secret import secret_pb2
+from user import user_type_pb2
 
 from src.utils.logger import logger
 
@@ -18,6 +26,12 @@ except RpcError as err:
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+TOKEN_CACHE_LOOKUPS = Counter("jwt_verification_cache_lookups_total", "Verified JWT cache lookups by result",
+                              ["result"])
+
+# sha256(token) -> (verified payload, exp); kept in LRU order
+verified_tokens: OrderedDict[bytes, tuple[dict, float]] = OrderedDict()
+
 
 def create_jwt_token(data: dict):
     data['iat'] = datetime.now(UTC)
@@ -25,14 +39,44 @@ def create_jwt_token(data: dict):
     return jwt.encode(data, JWT_SECRET_KEY, algorithm=ALGORITHM)
 
 
-def verify_jwt_token(token: str):
+def verify_jwt_token(token: str, log_errors: bool = True):
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
         return payload
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError) as e:
-        logger.error(f"Problems with token: {e}")
+        if log_errors:
+            logger.error(f"Problems with token: {e}")
         raise e
 
+def verify_jwt_token_cached(token: str, record: bool = True):
+    """
+    With record=False (probes ahead of verify_user) the lookup is neither counted nor logged, and a verified
+    token is not cached, so verify_user still records its own miss.
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+
+    cached = verified_tokens.get(digest)
+    if cached is not None:
+        payload, expires_at = cached
+        if expires_at > time.time():
+            verified_tokens.move_to_end(digest)
+            if record:
+                TOKEN_CACHE_LOOKUPS.labels(result="hit").inc()
+            return dict(payload)
+        del verified_tokens[digest]
+
+    if not record:
+        return verify_jwt_token(token, log_errors=False)
+
+    TOKEN_CACHE_LOOKUPS.labels(result="miss").inc()
+    payload = verify_jwt_token(token)
+
+    if "exp" in payload:
+        verified_tokens[digest] = (dict(payload), float(payload["exp"]))
+        if len(verified_tokens) > JWT_CACHE_MAX_SIZE:
+            verified_tokens.popitem(last=False)
+    return payload
+
 def refresh_jwt_token(token: str):
     payload = verify_jwt_token(token)
     if payload is not None:
@@ -48,7 +92,8 @@ def verify_user(authorization_header: str):
     try:
         if authorization_header.startswith("Bearer "):
             token = authorization_header.split(" ")[1]
-            payload = verify_jwt_token(token)
+            with measure("auth"):
+                payload = verify_jwt_token_cached(token)
         else:
             logger.warning("Invalid authorization scheme")
             raise HTTPException(status_code=401, detail = "invalid_auth_scheme")
@@ -66,3 +111,15 @@ def verify_user(authorization_header: str):
         )
     return payload
 
+
+def is_super_admin(authorization_header: str | None) -> bool:
+    """
+    verify_user for optional extras: a missing or invalid token is not an error, just not a super admin.
+    """
+    if authorization_header is None or not authorization_header.startswith("Bearer "):
+        return False
+    try:
+        payload = verify_jwt_token_cached(authorization_header.split(" ")[1], record=False)
+    except jwt.InvalidTokenError:
+        return False
+    return payload.get("user_type", 0) >= user_type_pb2.USER_TYPE_SUPER_ADMIN_USER
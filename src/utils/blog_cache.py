@@ -0,0 +1,108 @@
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from grpc import RpcError
+from prometheus_client import Counter, Gauge
+
+from blog import blog_pb2
+from src.connections import aio
+from src.utils import BLOG_CACHE_MAX_BYTES, BLOG_CACHE_TTL_SECONDS, BLOG_CACHE_MAX_STALE_SECONDS
+from src.utils.compression import PrecompressedBody
+from src.utils.etag import etag_for
+from src.utils.proto_json import render_json
+from src.utils.singleflight import singleflight
+
+from src.utils.logger import logger
+
+REQUESTS = Counter("blog_cache_requests_total", "Blog reads by cache result", ["result"])
+INVALIDATIONS = Counter("blog_cache_invalidated_entries_total", "Blog cache entries dropped by blog writes")
+EVICTIONS = Counter("blog_cache_evicted_entries_total", "Blog cache entries evicted to stay under the size limit")
+SIZE = Gauge("blog_cache_bytes", "Serialized and rendered size of blog lists held in the blog cache")
+
+
+class BlogCacheEntry(NamedTuple):
+    blogs: blog_pb2.BlogList
+    body: PrecompressedBody
+    etag: str
+    size: int
+    stored_at: float
+
+    @classmethod
+    def create(cls, blogs: blog_pb2.BlogList) -> "BlogCacheEntry":
+        serialized = blogs.SerializeToString(deterministic=True)
+        body = PrecompressedBody(render_json(blogs, always_print_fields_with_no_presence=True))
+        # Encoded variants are added to the body on first use and are not counted; they are a fraction of its size
+        return cls(blogs, body, etag_for(serialized), len(serialized) + len(body.content), time.monotonic())
+
+
+class BlogCache:
+    """
+    GetBlogs responses per (title, language, path) filter.
+
+    Entries are fresh for ttl seconds. A write invalidates every entry whose language and path filters could
+    match the written blog - title filters are not compared, as an update may rename the blog. If
+    Mongo_Manager fails, an expired entry is still served for up to max_stale seconds past its ttl. Least
+    recently used entries are evicted once the serialized and rendered blog lists exceed max_bytes.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, max_stale: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.size = 0
+        self._entries: OrderedDict[tuple[str, str, str], BlogCacheEntry] = OrderedDict()
+        # Bumped by every write, so a read started before it does not store what it fetched
+        self._generation = 0
+        SIZE.set_function(lambda: self.size)
+
+    async def get(self, title: str, language: str, path: str) -> BlogCacheEntry:
+        key = (title, language, path)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and now - entry.stored_at < self.ttl:
+            self._entries.move_to_end(key)
+            REQUESTS.labels(result="hit").inc()
+            return entry
+
+        generation = self._generation
+        try:
+            blogs: blog_pb2.BlogList = await singleflight.call(
+                aio.blog_stub, "GetBlogs", blog_pb2.FilterBlogMessage(title=title, language=language, path=path))
+        except RpcError as e:
+            if (entry is not None and self._entries.get(key) is entry
+                    and now - entry.stored_at < self.ttl + self.max_stale):
+                logger.warning(f"Serving stale blogs for {key}: {e}")
+                REQUESTS.labels(result="stale").inc()
+                return entry
+            raise
+
+        REQUESTS.labels(result="miss").inc()
+        entry = BlogCacheEntry.create(blogs)
+        if generation == self._generation:
+            self._store(key, entry)
+        return entry
+
+    def invalidate(self, language: str, path: str):
+        self._generation += 1
+        language, path = language.lower(), path.lower()
+        stale_keys = [key for key in self._entries
+                      if key[1].lower() in ("", language) and key[2].lower() in ("", path)]
+        for key in stale_keys:
+            self.size -= self._entries.pop(key).size
+        INVALIDATIONS.inc(len(stale_keys))
+
+    def _store(self, key: tuple[str, str, str], entry: BlogCacheEntry):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= previous.size
+        self._entries[key] = entry
+        self.size += entry.size
+
+        while self.size > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+            EVICTIONS.inc()
+
+
+blog_cache = BlogCache(BLOG_CACHE_MAX_BYTES, BLOG_CACHE_TTL_SECONDS, BLOG_CACHE_MAX_STALE_SECONDS)
@@ -0,0 +1,362 @@
+import asyncio
+import functools
+import heapq
+import html
+import math
+import re
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Iterable
+from operator import itemgetter
+from typing import NamedTuple
+
+from grpc import RpcError
+from prometheus_client import Gauge, Histogram
+
+from blog import blog_pb2
+from src.connections import aio
+from src.utils import BLOG_SEARCH_REFRESH_SECONDS, BLOG_SEARCH_MAX_POSTINGS
+from src.utils.deadline import detached
+
+from src.utils.logger import logger
+
+DOCUMENTS = Gauge("blog_search_documents", "Blog posts held in the search index")
+QUERY_LATENCY = Histogram("blog_search_query_seconds", "Time to rank and page a blog search",
+                          buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+
+TOKEN = re.compile(r"[^\W_]+")
+
+# BM25 parameters; title terms count as TITLE_WEIGHT occurrences
+K1 = 1.2
+B = 0.75
+TITLE_WEIGHT = 3
+
+SNIPPET_TOKENS = 30
+SNIPPET_CONTEXT_TOKENS = 3
+MIN_STEM_LENGTH = 3
+
+# Light suffix stripping, longest suffix first. Queries and posts go through the same rules, so a stem
+# only has to be consistent, not linguistically correct. Other languages are indexed unstemmed.
+SUFFIXES = {
+    "en": (("ational", "ate"), ("ization", "ize"), ("fulness", "ful"), ("iveness", "ive"), ("ousness", "ous"),
+           ("ments", "ment"), ("ingly", ""), ("edly", ""), ("ness", ""), ("ings", ""), ("sses", "ss"),
+           ("ches", "ch"), ("shes", "sh"), ("ies", "y"), ("ied", "y"), ("xes", "x"), ("zes", "z"), ("ing", ""),
+           ("ly", ""), ("ed", ""), ("s", "")),
+    "pl": (("owania", ""), ("owanie", ""), ("ościach", ""), ("ościami", ""), ("ości", ""), ("ość", ""),
+           ("ach", ""), ("ami", ""), ("ego", ""), ("emu", ""), ("ich", ""), ("ych", ""), ("imi", ""), ("ymi", ""),
+           ("owi", ""), ("ów", ""), ("om", ""), ("em", ""), ("ie", ""), ("ia", ""), ("ii", ""), ("ą", ""), ("ę", ""),
+           ("a", ""), ("e", ""), ("i", ""), ("y", ""), ("u", ""), ("o", "")),
+}
+KEEP_ENDINGS = {"en": ("ss", "us", "is")}
+# Dropped after the suffix, so "price", "prices" and "pricing" share a stem
+FINAL_LETTERS = {"en": "e"}
+
+
+@functools.lru_cache(maxsize=1 << 18)
+def stem(token: str, language: str) -> str:
+    if token.endswith(KEEP_ENDINGS.get(language, ())):
+        return token
+    for suffix, replacement in SUFFIXES.get(language, ()):
+        if token.endswith(suffix) and len(token) - len(suffix) + len(replacement) >= MIN_STEM_LENGTH:
+            token = token[:-len(suffix)] + replacement
+            break
+    final_letters = FINAL_LETTERS.get(language)
+    if final_letters and token[-1] in final_letters and len(token) > MIN_STEM_LENGTH:
+        token = token[:-1]
+    return token
+
+
+def analyze(text: str, language: str) -> list[str]:
+    return [stem(token, language) for token in TOKEN.findall(text.lower())]
+
+
+def snippet(content: str, terms: set[str], language: str) -> str:
+    """
+    HTML-escaped excerpt around the densest run of matching words, with matches wrapped in <mark>.
+    """
+    tokens = list(TOKEN.finditer(content))
+    if not tokens:
+        return ""
+
+    hits = [index for index, token in enumerate(tokens) if stem(token.group().lower(), language) in terms]
+    first = 0
+    if hits:
+        best = max(hits, key=lambda hit: bisect_left(hits, hit + SNIPPET_TOKENS) - bisect_left(hits, hit))
+        first = max(best - SNIPPET_CONTEXT_TOKENS, 0)
+    last = min(first + SNIPPET_TOKENS, len(tokens)) - 1
+
+    parts = ["…" if first > 0 else ""]
+    position = tokens[first].start() if first > 0 else 0
+    hit_set = set(hits)
+    for index in range(first, last + 1):
+        token = tokens[index]
+        parts.append(html.escape(content[position:token.start()]))
+        word = html.escape(token.group())
+        parts.append(f"<mark>{word}</mark>" if index in hit_set else word)
+        position = token.end()
+    parts.append("…" if last < len(tokens) - 1 else html.escape(content[position:]))
+    return "".join(parts)
+
+
+class IndexedBlog(NamedTuple):
+    blog: blog_pb2.BlogContent
+    terms: Counter
+    length: int
+
+
+class SearchHit(NamedTuple):
+    blog: blog_pb2.BlogContent
+    score: float
+    snippet: str
+
+
+class LanguageIndex:
+    """
+    Postings (term -> path -> term frequency) and BM25 statistics of the posts in one language.
+    """
+
+    def __init__(self, max_postings: int):
+        self.max_postings = max_postings
+        self.postings: dict[str, dict[str, int]] = {}
+        self.lengths: dict[str, int] = {}
+        self.total_length = 0
+        self._norms: dict[str, float] | None = None
+        self._top_postings: dict[str, list[str]] = {}
+
+    def add(self, path: str, indexed: IndexedBlog):
+        for term, frequency in indexed.terms.items():
+            self.postings.setdefault(term, {})[path] = frequency
+        self.lengths[path] = indexed.length
+        self.total_length += indexed.length
+        self._norms = None
+        self._top_postings.clear()
+
+    def remove(self, path: str, indexed: IndexedBlog):
+        for term in indexed.terms:
+            postings = self.postings[term]
+            del postings[path]
+            if not postings:
+                del self.postings[term]
+        del self.lengths[path]
+        self.total_length -= indexed.length
+        self._norms = None
+        self._top_postings.clear()
+
+    def norms(self) -> dict[str, float]:
+        if self._norms is None:
+            average_length = self.total_length / len(self.lengths) if self.lengths else 1
+            self._norms = {path: K1 * (1 - B + B * length / average_length) for path, length in self.lengths.items()}
+        return self._norms
+
+    def top_postings(self, term: str) -> list[str]:
+        """
+        The max_postings posts where the term weighs most, i.e. with the highest frequency for their length.
+        """
+        top = self._top_postings.get(term)
+        if top is None:
+            postings, norms = self.postings[term], self.norms()
+            top = heapq.nlargest(self.max_postings, postings,
+                                 key=lambda path: postings[path] / (postings[path] + norms[path]))
+            self._top_postings[term] = top
+        return top
+
+    def score(self, terms: set[str]) -> tuple[int, dict[str, float]]:
+        """
+        Number of posts containing any of the terms, and BM25 scores of the candidates to rank.
+
+        Searches run on the event loop, so a term found in more than max_postings posts only brings its top postings
+        as candidates; the others score lower on that term and are left out. Every candidate is scored on all terms.
+        """
+        norms = self.norms()
+        documents = len(self.lengths)
+        matched = {term: postings for term in terms if (postings := self.postings.get(term))}
+        if not matched:
+            return 0, {}
+
+        candidates = set()
+        truncated = False
+        for term, postings in matched.items():
+            if len(postings) > self.max_postings:
+                candidates.update(self.top_postings(term))
+                truncated = True
+            else:
+                candidates.update(postings)
+
+        scores = dict.fromkeys(candidates, 0.0)
+        for postings in matched.values():
+            weight = (K1 + 1) * self.idf(documents, postings)
+            if len(postings) <= len(scores):
+                for path, frequency in postings.items():
+                    if path in scores:
+                        scores[path] += weight * frequency / (frequency + norms[path])
+            else:
+                get = postings.get
+                for path in scores:
+                    if frequency := get(path):
+                        scores[path] += weight * frequency / (frequency + norms[path])
+
+        if not truncated:
+            return len(scores), scores
+        if len(matched) == 1:
+            return len(next(iter(matched.values()))), scores
+        return len(set().union(*matched.values())), scores
+
+    @staticmethod
+    def idf(documents: int, postings: dict[str, int]) -> float:
+        return math.log(1 + (documents - len(postings) + 0.5) / (len(postings) + 0.5))
+
+
+class BlogSearchIndex:
+    """
+    In-memory inverted index over all blog posts with BM25 ranking, one index per language.
+
+    Built from GetBlogs in the background on start and on every refresh interval, and updated in place by the
+    blog write endpoints. Writes made while a refresh runs are replayed onto the new index before it is swapped in,
+    as GetBlogs may not have seen them.
+    """
+
+    def __init__(self, refresh_interval: float, max_postings: int):
+        self.refresh_interval = refresh_interval
+        self.max_postings = max_postings
+        self.loaded = False
+        self._documents: dict[tuple[str, str], IndexedBlog] = {}
+        self._languages: dict[str, LanguageIndex] = {}
+        self._refresh_writes: list[tuple] | None = None
+        self._refresh_task: asyncio.Task | None = None
+        self._loop_task: asyncio.Task | None = None
+        DOCUMENTS.set_function(lambda: len(self._documents))
+
+    async def start(self):
+        # Not awaited: building a large index takes a while, searches wait for it through ensure_loaded
+        self._background_refresh()
+        self._loop_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        tasks = [task for task in (self._loop_task, self._refresh_task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+        self._refresh_task = None
+
+    async def ensure_loaded(self):
+        """
+        Waits for the first index build, starting one if the last attempt failed.
+        """
+        if not self.loaded:
+            await asyncio.shield(self._background_refresh())
+
+    async def refresh(self):
+        self._refresh_writes = writes = []
+        try:
+            blog_list: blog_pb2.BlogList = await aio.blog_stub.GetBlogs(blog_pb2.FilterBlogMessage())
+            # Tokenizing every post would block the event loop for seconds, so the new index is built in a thread
+            # on its own dicts and only swapped in here
+            documents, languages = await asyncio.to_thread(self._build, blog_list.Blogs, self.max_postings)
+        finally:
+            self._refresh_writes = None
+
+        for write, *args in writes:
+            write(documents, languages, *args)
+        self._documents, self._languages = documents, languages
+        self.loaded = True
+        logger.info(f"Blog search index built from {len(blog_list.Blogs)} posts, "
+                    f"{len(writes)} writes made meanwhile replayed")
+
+    def upsert(self, blog: blog_pb2.BlogContent):
+        self._upsert(self._documents, self._languages, blog)
+        if self._refresh_writes is not None:
+            self._refresh_writes.append((self._upsert, blog))
+
+    def remove(self, language: str, path: str):
+        self._remove(self._documents, self._languages, language, path)
+        if self._refresh_writes is not None:
+            self._refresh_writes.append((self._remove, language, path))
+
+    def search(self, query: str, language: str | None, offset: int, limit: int) -> tuple[int, list[SearchHit]]:
+        with QUERY_LATENCY.time():
+            languages = [language.lower()] if language else list(self._languages)
+            query_terms = {}
+            total = 0
+            best = []
+            for language_code in languages:
+                index = self._languages.get(language_code)
+                if index is None:
+                    continue
+                query_terms[language_code] = terms = set(analyze(query, language_code))
+                matches, scores = index.score(terms)
+                total += matches
+                best.extend((score, language_code, path)
+                            for path, score in heapq.nlargest(offset + limit, scores.items(), key=itemgetter(1)))
+
+            page = heapq.nlargest(offset + limit, best)[offset:]
+
+        hits = []
+        for score, language_code, path in page:
+            blog = self._documents[(language_code, path)].blog
+            hits.append(SearchHit(blog, score, snippet(blog.content, query_terms[language_code], language_code)))
+        return total, hits
+
+    @classmethod
+    def _build(cls, blogs: Iterable[blog_pb2.BlogContent], max_postings: int) \
+            -> tuple[dict[tuple[str, str], IndexedBlog], dict[str, LanguageIndex]]:
+        documents, languages = {}, {}
+        for blog in blogs:
+            cls._index_blog(documents, languages, blog, max_postings)
+        for index in languages.values():
+            index.norms()
+            for term, postings in index.postings.items():
+                if len(postings) > max_postings:
+                    index.top_postings(term)
+        return documents, languages
+
+    def _upsert(self, documents: dict[tuple[str, str], IndexedBlog], languages: dict[str, LanguageIndex],
+                blog: blog_pb2.BlogContent):
+        self._remove(documents, languages, blog.language, blog.path)
+        self._index_blog(documents, languages, blog, self.max_postings)
+
+    @staticmethod
+    def _remove(documents: dict[tuple[str, str], IndexedBlog], languages: dict[str, LanguageIndex],
+                language: str, path: str):
+        key = (language.lower(), path)
+        indexed = documents.pop(key, None)
+        if indexed is not None:
+            languages[key[0]].remove(path, indexed)
+
+    @staticmethod
+    def _index_blog(documents: dict[tuple[str, str], IndexedBlog], languages: dict[str, LanguageIndex],
+                    blog: blog_pb2.BlogContent, max_postings: int):
+        language = blog.language.lower()
+        terms = Counter(analyze(blog.content, language))
+        for term in analyze(blog.title, language):
+            terms[term] += TITLE_WEIGHT
+
+        indexed = IndexedBlog(blog, terms, sum(terms.values()))
+        documents[(language, blog.path)] = indexed
+        if language not in languages:
+            languages[language] = LanguageIndex(max_postings)
+        languages[language].add(blog.path, indexed)
+
+    def _background_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            # Shared with every search waiting for the index, so it must not inherit this request's deadline
+            with detached():
+                self._refresh_task = asyncio.create_task(self.refresh())
+            self._refresh_task.add_done_callback(self._log_refresh_failure)
+        return self._refresh_task
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await asyncio.shield(self._background_refresh())
+            except RpcError:
+                pass
+
+    @staticmethod
+    def _log_refresh_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Building blog search index failed: {task.exception()}")
+
+
+blog_search = BlogSearchIndex(BLOG_SEARCH_REFRESH_SECONDS, BLOG_SEARCH_MAX_POSTINGS)
@@ -0,0 +1,59 @@
+import time
+from typing import NamedTuple
+
+from prometheus_client import Counter
+
+from coins import coins_pb2
+from src.connections import aio
+from src.utils import COIN_LIST_TTL_SECONDS
+from src.utils.compression import PrecompressedBody
+from src.utils.etag import etag_for
+from src.utils.proto_json import render_json
+from src.utils.singleflight import singleflight
+
+REQUESTS = Counter("coin_list_cache_requests_total", "Coin list reads by cache result", ["result"])
+
+
+class CoinListEntry(NamedTuple):
+    body: PrecompressedBody
+    etag: str
+    stored_at: float
+
+
+class CoinListCache:
+    """
+    Rendered GetListDataForAllCoins responses per fiat currency, fresh for ttl seconds.
+
+    Failed or empty responses are not cached.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: dict[str, CoinListEntry] = {}
+
+    async def get(self, currency: str) -> CoinListEntry | None:
+        start = time.monotonic()
+        entry = self._entries.get(currency)
+        if entry is not None and start - entry.stored_at < self.ttl:
+            REQUESTS.labels(result="hit").inc()
+            return entry
+
+        response: coins_pb2.ListDataForAllCoinsResponse = await singleflight.call(
+            aio.prices_stub, "GetListDataForAllCoins", coins_pb2.ListDataForAllCoinsRequest(fiat_currency=currency))
+        if response.status != "success" or len(response.data) == 0:
+            REQUESTS.labels(result="unavailable").inc()
+            return None
+
+        # Callers that shared the RPC reuse the entry rendered by the first of them
+        entry = self._entries.get(currency)
+        if entry is not None and entry.stored_at >= start:
+            REQUESTS.labels(result="coalesced").inc()
+            return entry
+
+        REQUESTS.labels(result="miss").inc()
+        content = render_json({"coins": list(response.data)}, always_print_fields_with_no_presence=True)
+        entry = self._entries[currency] = CoinListEntry(PrecompressedBody(content), etag_for(content), time.monotonic())
+        return entry
+
+
+coin_list_cache = CoinListCache(COIN_LIST_TTL_SECONDS)
@@ -0,0 +1,181 @@
+import gzip
+from collections.abc import Callable, Mapping
+
+import brotli
+import zstandard
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.utils import COMPRESSION_MIN_BYTES
+
+INPUT_BYTES = Counter("http_compression_input_bytes_total", "Response bytes before compression", ["coding", "source"])
+OUTPUT_BYTES = Counter("http_compression_output_bytes_total", "Response bytes after compression", ["coding", "source"])
+PRECOMPRESSED = Counter("http_precompressed_responses_total",
+                        "Responses served from a cached body by whether the encoded variant was already cached",
+                        ["coding", "result"])
+
+# In order of preference. Higher levels gain ~1% on JSON at several times the cost, so cached bodies use these too
+CODINGS: dict[str, Callable[[bytes], bytes]] = {
+    "zstd": lambda data: zstandard.compress(data, 3),
+    "br": lambda data: brotli.compress(data, quality=4),
+    "gzip": lambda data: gzip.compress(data, compresslevel=6, mtime=0),
+}
+# Bodies this large are compressed off the event loop
+THREAD_MIN_BYTES = 256 * 1024
+
+
+def negotiate(accept_encoding: str | None) -> str | None:
+    """
+    Picks the content-coding for an Accept-Encoding header: the highest q-value wins and ties go to the order
+    of CODINGS. None means the body is sent as is.
+    """
+    if not accept_encoding:
+        return None
+
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, parameters = item.partition(";")
+        weight = 1.0
+        for parameter in parameters.split(";"):
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip().lower()] = weight
+
+    wildcard = weights.get("*", 0.0)
+    coding, weight = max(((coding, weights.get(coding, wildcard)) for coding in CODINGS),
+                         key=lambda candidate: candidate[1])
+    return coding if weight > 0 else None
+
+
+def is_compressible(content_type: str | None) -> bool:
+    if not content_type:
+        return False
+    media_type = content_type.partition(";")[0].strip().lower()
+    return media_type.startswith("text/") or media_type.endswith(("json", "javascript", "xml"))
+
+
+async def compress(data: bytes, coding: str) -> bytes:
+    if len(data) >= THREAD_MIN_BYTES:
+        return await run_in_threadpool(CODINGS[coding], data)
+    return CODINGS[coding](data)
+
+
+def vary_on_accept_encoding(headers: MutableHeaders):
+    vary = headers.get("vary", "")
+    if "accept-encoding" not in (value.strip().lower() for value in vary.split(",")):
+        headers.add_vary_header("Accept-Encoding")
+
+
+def weak_etag(headers: MutableHeaders):
+    # The encoded body is not byte-identical to the one the tag was computed over
+    etag = headers.get("etag")
+    if etag is not None and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+
+class PrecompressedBody:
+    """
+    A rendered response body kept in a cache together with its encoded variants, so a payload served
+    repeatedly is compressed once per content-coding instead of once per request.
+    """
+
+    def __init__(self, content: bytes, media_type: str = "application/json"):
+        self.content = content
+        self.media_type = media_type
+        self._encoded: dict[str, bytes] = {}
+
+    async def encoded(self, coding: str) -> bytes:
+        data = self._encoded.get(coding)
+        if data is not None:
+            PRECOMPRESSED.labels(coding=coding, result="hit").inc()
+            return data
+
+        PRECOMPRESSED.labels(coding=coding, result="miss").inc()
+        data = self._encoded[coding] = await compress(self.content, coding)
+        INPUT_BYTES.labels(coding=coding, source="cache").inc(len(self.content))
+        OUTPUT_BYTES.labels(coding=coding, source="cache").inc(len(data))
+        return data
+
+    async def response(self, request: Request, headers: Mapping[str, str] | None = None) -> Response:
+        response = Response(self.content, media_type=self.media_type, headers=headers)
+        vary_on_accept_encoding(response.headers)
+        if len(self.content) < COMPRESSION_MIN_BYTES:
+            return response
+
+        coding = negotiate(request.headers.get("accept-encoding"))
+        if coding is not None:
+            response.body = await self.encoded(coding)
+            response.headers["Content-Encoding"] = coding
+            response.headers["Content-Length"] = str(len(response.body))
+            weak_etag(response.headers)
+        return response
+
+
+class CompressionMiddleware:
+    """
+    Compresses text and JSON response bodies of at least minimum_size bytes with the content-coding negotiated
+    from Accept-Encoding (zstd, br or gzip).
+
+    Responses that already carry a Content-Encoding, such as those built from a PrecompressedBody, pass through.
+    Must sit outside ETagMiddleware, so tags are computed over the uncompressed body.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        coding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        start_message: Message | None = None
+        body = []
+
+        async def send_compressed(message: Message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if (message["status"] in (204, 304) or "content-encoding" in headers
+                        or not is_compressible(headers.get("content-type"))):
+                    await send(message)
+                    return
+                vary_on_accept_encoding(headers)
+                if coding is None:
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if start_message is None:
+                await send(message)
+                return
+
+            body.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            content = b"".join(body)
+            if len(content) >= self.minimum_size:
+                compressed = await compress(content, coding)
+                INPUT_BYTES.labels(coding=coding, source="response").inc(len(content))
+                OUTPUT_BYTES.labels(coding=coding, source="response").inc(len(compressed))
+
+                headers = MutableHeaders(scope=start_message)
+                headers["Content-Encoding"] = coding
+                headers["Content-Length"] = str(len(compressed))
+                weak_etag(headers)
+                content = compressed
+            await send(start_message)
+            await send({"type": "http.response.body", "body": content})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from typing import NamedTuple
+
+from grpc import RpcError
+from prometheus_client import Counter
+
+from currency import currency_pb2, currency_type_pb2
+from src.connections import aio
+from src.utils import CURRENCY_REGISTRY_REFRESH_SECONDS, CURRENCY_NEGATIVE_TTL_SECONDS
+from src.utils.etag import etag_for
+from src.utils.singleflight import singleflight
+
+from src.utils.logger import logger
+
+LOOKUPS = Counter("currency_registry_lookups_total", "Currency type lookups by result", ["result"])
+
+NEGATIVE_CACHE_MAX_SIZE = 10_000
+
+
+class VersionedCurrencyList(NamedTuple):
+    currencies: currency_pb2.CurrencyList
+    etag: str
+
+    @classmethod
+    def create(cls, currencies: currency_pb2.CurrencyList) -> "VersionedCurrencyList":
+        return cls(currencies, etag_for(currencies.SerializeToString(deterministic=True)))
+
+
+class CurrencyRegistry:
+    """
+    In-memory currency name -> CurrencyType map built from GetSupportedCurrencies, which also keeps the
+    supported currency lists themselves.
+
+    Names missing from the map fall back to GetCurrencyType; NOT_SUPPORTED answers are remembered
+    for negative_ttl seconds so unknown names do not hit Mongo_Manager on every request.
+    """
+
+    def __init__(self, refresh_interval: float, negative_ttl: float):
+        self.refresh_interval = refresh_interval
+        self.negative_ttl = negative_ttl
+        self._types: dict[str, int] = {}
+        self._lists: dict[int, VersionedCurrencyList] = {}
+        self._not_supported: dict[str, float] = {}
+        self._loop_task: asyncio.Task | None = None
+
+    async def start(self):
+        try:
+            await self.refresh()
+        except RpcError as e:
+            logger.error(f"Initial currency registry could not be loaded: {e}")
+        self._loop_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+
+    async def refresh(self):
+        types = {}
+        lists = {}
+        for currency_type in (currency_type_pb2.CURRENCY_TYPE_FIAT, currency_type_pb2.CURRENCY_TYPE_CRYPTO):
+            currencies_list: currency_pb2.CurrencyList = await aio.currency_stub.GetSupportedCurrencies(
+                currency_pb2.CurrencyTypeMsg(type=currency_type))
+            lists[currency_type] = VersionedCurrencyList.create(currencies_list)
+            for currency in currencies_list.currencies:
+                types[currency.currency_name.lower()] = currency_type
+
+        self._types = types
+        self._lists = lists
+        self._not_supported = {}
+        logger.info(f"Currency registry loaded {len(types)} currencies")
+
+    async def get_type(self, currency_name: str) -> int:
+        key = currency_name.lower()
+
+        currency_type = self._types.get(key)
+        if currency_type is not None:
+            LOOKUPS.labels(result="hit").inc()
+            return currency_type
+
+        expires_at = self._not_supported.get(key)
+        if expires_at is not None:
+            if expires_at > time.monotonic():
+                LOOKUPS.labels(result="negative_hit").inc()
+                return currency_type_pb2.CURRENCY_TYPE_NOT_SUPPORTED
+            del self._not_supported[key]
+
+        LOOKUPS.labels(result="miss").inc()
+        response: currency_pb2.CurrencyTypeMsg = await singleflight.call(
+            aio.currency_stub, "GetCurrencyType", currency_pb2.CurrencyDetails(currency_name=currency_name))
+
+        if response.type == currency_type_pb2.CURRENCY_TYPE_NOT_SUPPORTED:
+            if len(self._not_supported) >= NEGATIVE_CACHE_MAX_SIZE:
+                self._not_supported.pop(next(iter(self._not_supported)))
+            self._not_supported[key] = time.monotonic() + self.negative_ttl
+        else:
+            self._types[key] = response.type
+        return response.type
+
+    async def get_currencies(self, currency_type: int) -> VersionedCurrencyList:
+        currencies = self._lists.get(currency_type)
+        if currencies is not None:
+            LOOKUPS.labels(result="list_hit").inc()
+            return currencies
+
+        LOOKUPS.labels(result="list_miss").inc()
+        currencies_list: currency_pb2.CurrencyList = await singleflight.call(
+            aio.currency_stub, "GetSupportedCurrencies", currency_pb2.CurrencyTypeMsg(type=currency_type))
+        return VersionedCurrencyList.create(currencies_list)
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except RpcError as e:
+                logger.error(f"Refreshing currency registry failed: {e}")
+
+
+currency_registry = CurrencyRegistry(CURRENCY_REGISTRY_REFRESH_SECONDS, CURRENCY_NEGATIVE_TTL_SECONDS)
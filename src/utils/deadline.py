@@ -0,0 +1,122 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import Counter
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.utils import DEADLINE_DEFAULT_SECONDS, DEADLINE_ROUTE_SECONDS, RPC_TIMEOUT_SECONDS
+from src.utils.proto_json import ProtoJSONResponse
+
+DEADLINES_EXCEEDED = Counter("grpc_client_deadline_exceeded_total",
+                             "Backend calls that ran out of time, by the limit that was reached: the request's "
+                             "deadline budget or the per-RPC timeout",
+                             ["backend", "grpc_method", "limit"])
+
+# Headers of the replaced 500 that still describe the 504 sent instead
+KEPT_HEADERS = (b"server-timing", b"vary", b"access-control-")
+
+
+class RequestDeadline:
+    """
+    Deadline of one request: its start plus the budget configured for the route template, or the default one.
+    """
+
+    def __init__(self, scope: Scope):
+        self.scope = scope
+        self.start = time.monotonic()
+        # Set by the interceptors when a backend call ran out of time
+        self.exceeded = False
+        self._deadline: float | None = None
+
+    @property
+    def deadline(self) -> float:
+        # Resolved on first use, as the route is only known once the router matched the request
+        if self._deadline is None:
+            route = self.scope.get("route")
+            budget = DEADLINE_ROUTE_SECONDS.get(route.path, DEADLINE_DEFAULT_SECONDS) if route is not None \
+                else DEADLINE_DEFAULT_SECONDS
+            self._deadline = self.start + budget
+        return self._deadline
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+
+current_deadline: ContextVar[RequestDeadline | None] = ContextVar("request_deadline", default=None)
+
+
+def rpc_timeout(timeout: float | None = None) -> tuple[float, bool]:
+    """
+    Timeout for a backend call started now, and whether the request deadline (rather than the per-RPC timeout)
+    set it. Once the request has no time left the timeout is 0, so the call fails with DEADLINE_EXCEEDED at once.
+    """
+    limit = RPC_TIMEOUT_SECONDS if timeout is None else min(timeout, RPC_TIMEOUT_SECONDS)
+    request_deadline = current_deadline.get()
+    if request_deadline is None:
+        return limit, False
+
+    remaining = max(request_deadline.remaining(), 0.0)
+    return (remaining, True) if remaining < limit else (limit, False)
+
+
+def deadline_exceeded(backend: str, grpc_method: str, request_limited: bool):
+    DEADLINES_EXCEEDED.labels(backend=backend, grpc_method=grpc_method,
+                              limit="request" if request_limited else "rpc").inc()
+    mark_deadline_exceeded()
+
+
+def mark_deadline_exceeded():
+    request_deadline = current_deadline.get()
+    if request_deadline is not None:
+        request_deadline.exceeded = True
+
+
+@contextmanager
+def detached():
+    """
+    Runs the block, and tasks created in it, without the current request's deadline: for work that must finish
+    even if the request ran out of time (compensations) or outlives the request (shared background refreshes).
+    """
+    token = current_deadline.set(None)
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+class DeadlineMiddleware:
+    """
+    Gives every request a RequestDeadline. The routers answer a failed backend call with 500; when the call ran out
+    of time, that response is replaced by a 504.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_deadline = RequestDeadline(scope)
+        timeout_response: ProtoJSONResponse | None = None
+
+        async def send_with_deadline(message: Message):
+            nonlocal timeout_response
+            if message["type"] == "http.response.start" and message["status"] == 500 and request_deadline.exceeded:
+                timeout_response = ProtoJSONResponse({"detail": "deadline_exceeded"}, status_code=504)
+                kept = [(name, value) for name, value in message.get("headers", []) if name.lower().startswith(KEPT_HEADERS)]
+                await send({"type": "http.response.start", "status": 504,
+                            "headers": timeout_response.raw_headers + kept})
+                return
+            if timeout_response is None:
+                await send(message)
+            elif not message.get("more_body", False):
+                await send({"type": "http.response.body", "body": timeout_response.body})
+
+        token = current_deadline.set(request_deadline)
+        try:
+            await self.app(scope, receive, send_with_deadline)
+        finally:
+            current_deadline.reset(token)
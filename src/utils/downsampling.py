@@ -0,0 +1,85 @@
+import numpy as np
+
+from src.utils.historical_cache import is_columnar
+
+MIN_POINTS = 3
+VALUE_COLUMN = "price"
+# Totals over a candle, summed when candles are merged. Other columns are point in time (close, market_cap)
+# and take the value of the last candle.
+ADDITIVE_COLUMNS = {"volume", "volumes", "total_volume", "total_volumes"}
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: keeps the first and last point and, from every bucket in between, the point
+    forming the largest triangle with the previously kept point and the average of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < MIN_POINTS:
+        return np.arange(n)
+
+    # Integer arithmetic keeps bucket edges exact, the last edge is n - 1
+    edges = np.arange(threshold - 1, dtype=np.intp) * (n - 2) // (threshold - 2) + 1
+    sizes = np.diff(edges)
+    next_x = np.append(np.add.reduceat(x[:n - 1], edges[:-1]) / sizes, x[-1])[1:]
+    next_y = np.append(np.add.reduceat(y[:n - 1], edges[:-1]) / sizes, y[-1])[1:]
+
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[previous], y[previous]
+        areas = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        previous = lo + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def downsample_series(data: dict[str, list], max_points: int) -> dict[str, list]:
+    if not is_columnar(data) or len(data["timestamp"]) <= max_points:
+        return data
+
+    value_column = VALUE_COLUMN if VALUE_COLUMN in data else next((name for name in data if name != "timestamp"), None)
+    if value_column is None:
+        return data
+
+    indices = lttb_indices(np.asarray(data["timestamp"], dtype=np.float64),
+                           np.asarray(data[value_column], dtype=np.float64),
+                           max_points)
+    return {name: np.asarray(values)[indices].tolist() for name, values in data.items()}
+
+
+def aggregate_candles(data: dict[str, list], max_points: int) -> dict[str, list]:
+    """
+    Merges consecutive candles into candles of a whole multiple of the original interval, aligned to that
+    interval. Timestamps are candle close times, so a merged candle takes the last timestamp of its group.
+    """
+    if not is_columnar(data) or len(data["timestamp"]) <= max_points:
+        return data
+
+    timestamps = np.asarray(data["timestamp"], dtype=np.float64)
+    interval = float(np.median(np.diff(timestamps)))
+    if interval <= 0:
+        return data
+
+    # Aligning the groups can add one partial candle at each end
+    factor = int(np.ceil(len(timestamps) / (max_points - 2)))
+    groups = np.ceil(timestamps / (interval * factor))
+    starts = np.flatnonzero(np.append(True, groups[1:] != groups[:-1]))
+    ends = np.append(starts[1:], len(timestamps)) - 1
+
+    aggregated = {}
+    for name, values in data.items():
+        values = np.asarray(values)
+        if name == "open":
+            aggregated[name] = values[starts].tolist()
+        elif name == "high":
+            aggregated[name] = np.maximum.reduceat(values, starts).tolist()
+        elif name == "low":
+            aggregated[name] = np.minimum.reduceat(values, starts).tolist()
+        elif name in ADDITIVE_COLUMNS:
+            aggregated[name] = np.add.reduceat(values, starts).tolist()
+        else:
+            aggregated[name] = values[ends].tolist()
+    return aggregated
@@ -0,0 +1,63 @@
+from collections.abc import Awaitable, Callable
+from timeit import default_timer
+
+from google.protobuf.message import Message
+from prometheus_client import Counter, Histogram
+
+from src.utils.deadline import detached
+
+from src.utils.logger import logger
+
+LEG_LATENCY = Histogram("dual_write_leg_seconds", "Latency of a single dual-write leg", ["operation", "leg"])
+COMPENSATIONS = Counter("dual_write_compensations_total", "Dual-write compensations by result",
+                        ["operation", "leg", "result"])
+
+Compensation = Callable[[Message], Awaitable]
+
+
+class DualWrite:
+    """
+    Coordinates the writes of one mutation that spans several DB_Manager calls.
+
+    Every successful leg may register a compensation - if the block exits with an exception, they run in
+    reverse order before the exception propagates.
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self._compensations: list[tuple[str, Compensation, Message]] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            await self._compensate()
+        return False
+
+    async def leg(self, name: str, call: Callable[[Message], Awaitable[Message]], request: Message,
+                  compensate: Compensation | None = None) -> Message:
+        start = default_timer()
+        try:
+            response = await call(request)
+        finally:
+            LEG_LATENCY.labels(operation=self.operation, leg=name).observe(max(default_timer() - start, 0))
+
+        if compensate is not None:
+            self._compensations.append((name, compensate, response))
+        return response
+
+    async def _compensate(self):
+        with detached():
+            await self._run_compensations()
+
+    async def _run_compensations(self):
+        while self._compensations:
+            name, compensate, response = self._compensations.pop()
+            try:
+                await compensate(response)
+                COMPENSATIONS.labels(operation=self.operation, leg=name, result="success").inc()
+                logger.warning(f"Compensated {self.operation} leg {name}")
+            except Exception as e:
+                COMPENSATIONS.labels(operation=self.operation, leg=name, result="failed").inc()
+                logger.error(f"Compensating {self.operation} leg {name} failed: {e}")
@@ -0,0 +1,91 @@
+import hashlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+def etag_for(data: bytes) -> str:
+    # Weak, so the tag survives a content-coding applied further out
+    return f'W/"{hashlib.blake2b(data, digest_size=12).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque_tag for candidate in if_none_match.split(","))
+
+
+def cache_control(headers: Headers) -> str:
+    # Clients must revalidate every time; responses to authenticated requests stay out of shared caches
+    return "private, no-cache" if "authorization" in headers else "no-cache"
+
+
+def not_modified(request: Request, etag: str) -> Response | None:
+    """
+    Returns a 304 response when the client already holds the version tagged etag, for endpoints that know
+    the version of their data before building the response.
+    """
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control(request.headers)})
+    return None
+
+
+class ETagMiddleware:
+    """
+    Adds ETag and Cache-Control headers to successful GET responses and answers a matching If-None-Match
+    with 304 and no body.
+
+    Responses that already carry an ETag (version stamps set by the endpoint) or are already encoded pass
+    through unbuffered; other bodies are buffered and hashed.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        start_message: Message | None = None
+        body = []
+
+        async def send_with_etag(message: Message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if "cache-control" not in headers:
+                    headers["Cache-Control"] = cache_control(request_headers)
+                if message["status"] != 200 or "etag" in headers or "content-encoding" in headers:
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if start_message is None:
+                await send(message)
+                return
+
+            body.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            content = b"".join(body)
+            headers = MutableHeaders(scope=start_message)
+            etag = etag_for(content)
+            headers["ETag"] = etag
+            if etag_matches(request_headers.get("if-none-match"), etag):
+                start_message["status"] = 304
+                del headers["content-length"]
+                del headers["content-type"]
+                content = b""
+            await send(start_message)
+            await send({"type": "http.response.body", "body": content})
+
+        await self.app(scope, receive, send_with_etag)
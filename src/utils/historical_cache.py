@@ -0,0 +1,196 @@
+import asyncio
+import math
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple
+
+from google.protobuf.timestamp_pb2 import Timestamp
+from prometheus_client import Counter, Gauge
+
+from coins import coins_pb2
+from src.connections import aio
+from src.utils import HISTORICAL_CACHE_MAX_POINTS
+from src.utils.proto_json import struct_to_json
+from src.utils.singleflight import singleflight
+
+BUCKETS = Counter("historical_cache_buckets_total", "Historical data buckets by result", ["result"])
+EVICTIONS = Counter("historical_cache_evicted_buckets_total", "Historical data buckets evicted to stay under the point limit")
+POINTS = Gauge("historical_cache_points", "Points held in the historical data cache")
+
+HOUR = 3600 * 1000
+DAY = 24 * HOUR
+
+
+class Tier(NamedTuple):
+    """
+    Price_Manager picks the point interval from the span of the requested range. Every fetch made for a tier
+    spans between min_fetch_span and max_span, so all buckets of a tier hold points of the same interval.
+    """
+    name: str
+    max_span: float
+    bucket: int
+    min_fetch_span: int
+
+
+PRICE_TIERS = (
+    Tier("5m", DAY, HOUR, 0),
+    Tier("1h", 90 * DAY, DAY, 2 * DAY),
+    Tier("1d", math.inf, 30 * DAY, 120 * DAY),
+)
+CANDLE_TIERS = (
+    Tier("30m", 2 * DAY, 6 * HOUR, 0),
+    Tier("4h", 30 * DAY, DAY, 3 * DAY),
+    Tier("4d", math.inf, 32 * DAY, 32 * DAY),
+)
+
+
+class HistoricalDataError(Exception):
+    def __init__(self, status: str, error_message: str):
+        super().__init__(status, error_message)
+        self.status = status
+        self.error_message = error_message
+
+
+def to_milliseconds(value: datetime) -> int:
+    timestamp = Timestamp()
+    timestamp.FromDatetime(value)
+    return timestamp.ToMilliseconds()
+
+
+def is_columnar(data: dict) -> bool:
+    timestamps = data.get("timestamp")
+    return (isinstance(timestamps, list)
+            and all(isinstance(values, list) and len(values) == len(timestamps) for values in data.values())
+            and all(a <= b for a, b in zip(timestamps, timestamps[1:])))
+
+
+class HistoricalDataCache:
+    """
+    Historical points per (coin, currency, ohlc, tier), kept in aligned time buckets.
+
+    A request is served from the cached buckets it overlaps; only runs of missing buckets are fetched.
+    Buckets that are not fully covered by a fetch, or that end less than a quarter bucket before now,
+    are used for the response but not stored. Least recently used buckets are evicted once the cache
+    holds more than max_points points.
+    """
+
+    def __init__(self, max_points: int):
+        self.max_points = max_points
+        self.points = 0
+        self._buckets: OrderedDict[tuple, dict[str, list]] = OrderedDict()
+        POINTS.set_function(lambda: self.points)
+
+    async def get(self, coin_id: str, currency: str, start_date: datetime, end_date: datetime,
+                  ohlc: bool) -> dict[str, list]:
+        start, end = to_milliseconds(start_date), to_milliseconds(end_date)
+        tier = next(tier for tier in (CANDLE_TIERS if ohlc else PRICE_TIERS) if end - start <= tier.max_span)
+        series = (coin_id, currency, ohlc, tier.name)
+        first, last = start // tier.bucket, end // tier.bucket
+
+        buckets = {}
+        missing = []
+        for index in range(first, last + 1):
+            bucket = self._buckets.get((series, index))
+            if bucket is None:
+                missing.append(index)
+            else:
+                self._buckets.move_to_end((series, index))
+                buckets[index] = bucket
+        BUCKETS.labels(result="hit").inc(len(buckets))
+        BUCKETS.labels(result="miss").inc(len(missing))
+
+        if missing:
+            now = int(time.time() * 1000)
+            windows = self._fetch_windows(missing, tier, now)
+            results = await asyncio.gather(*(self._fetch(coin_id, currency, window_start, window_end, ohlc)
+                                             for window_start, window_end in windows))
+            for (window_start, window_end), data in zip(windows, results):
+                if not is_columnar(data):
+                    # Unknown layout, pass the upstream answer through uncached
+                    return await self._fetch(coin_id, currency, start, end, ohlc)
+                complete_until = min(window_end, now - tier.bucket // 4)
+                for index, bucket in self._split(data, tier.bucket, window_start, window_end):
+                    if first <= index <= last:
+                        buckets[index] = bucket
+                    if window_start <= index * tier.bucket and (index + 1) * tier.bucket <= complete_until:
+                        self._store((series, index), bucket)
+
+        return self._assemble(buckets, first, last, start, end)
+
+    @staticmethod
+    def _fetch_windows(missing: list[int], tier: Tier, now: int) -> list[tuple[int, int]]:
+        max_buckets = math.inf if math.isinf(tier.max_span) else tier.max_span // tier.bucket - 1
+
+        runs = []
+        for index in missing:
+            if runs and index == runs[-1][1] + 1 and index - runs[-1][0] < max_buckets:
+                runs[-1][1] = index
+            else:
+                runs.append([index, index])
+
+        windows = []
+        for run_start, run_end in runs:
+            window_end = min((run_end + 1) * tier.bucket, now)
+            window_start = min(run_start * tier.bucket, window_end - tier.min_fetch_span)
+            windows.append((window_start // tier.bucket * tier.bucket, window_end))
+        return windows
+
+    async def _fetch(self, coin_id: str, currency: str, start: int, end: int, ohlc: bool) -> dict[str, list]:
+        start_date, end_date = Timestamp(), Timestamp()
+        start_date.FromMilliseconds(start)
+        end_date.FromMilliseconds(end)
+        request = coins_pb2.HistoricalDataRequest(coin_id=coin_id,
+                                                  fiat_currency=currency,
+                                                  start_date=start_date,
+                                                  end_date=end_date)
+        response: coins_pb2.DataResponse = await singleflight.call(
+            aio.prices_stub, "GetHistoricalCandleData" if ohlc else "GetHistoricalData", request)
+
+        if response.status != "success":
+            raise HistoricalDataError(response.status, response.error_message)
+        return struct_to_json(response.data)
+
+    @staticmethod
+    def _split(data: dict[str, list], bucket_size: int, start: int, end: int):
+        timestamps = data.get("timestamp", [])
+        # A point exactly at the window end belongs to the next bucket, which this window does not cover
+        for index in range(start // bucket_size, (end - 1) // bucket_size + 1):
+            lo = bisect_left(timestamps, index * bucket_size)
+            hi = bisect_left(timestamps, (index + 1) * bucket_size)
+            yield index, {name: values[lo:hi] for name, values in data.items()}
+
+    def _store(self, key: tuple, bucket: dict[str, list]):
+        previous = self._buckets.pop(key, None)
+        if previous is not None:
+            self.points -= bucket_points(previous)
+        self._buckets[key] = bucket
+        self.points += bucket_points(bucket)
+
+        while self.points > self.max_points and self._buckets:
+            _, evicted = self._buckets.popitem(last=False)
+            self.points -= bucket_points(evicted)
+            EVICTIONS.inc()
+
+    @staticmethod
+    def _assemble(buckets: dict[int, dict[str, list]], first: int, last: int, start: int, end: int) -> dict[str, list]:
+        data = {}
+        for index in range(first, last + 1):
+            bucket = buckets.get(index)
+            if bucket is None:
+                continue
+            timestamps = bucket.get("timestamp", [])
+            lo = bisect_left(timestamps, start) if index == first else 0
+            hi = bisect_right(timestamps, end) if index == last else len(timestamps)
+            for name, values in bucket.items():
+                data.setdefault(name, []).extend(values[lo:hi])
+        return data
+
+
+def bucket_points(bucket: dict[str, list]) -> int:
+    # Empty buckets still count, so ranges without data cannot grow the cache unbounded
+    return max(len(bucket.get("timestamp", ())), 1)
+
+
+historical_data_cache = HistoricalDataCache(HISTORICAL_CACHE_MAX_POINTS)
@@ -0,0 +1,62 @@
+import time
+
+from opentelemetry import trace
+from prometheus_client import Counter, Histogram
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import src.utils.OpenTelemetry.OpenTelemetry as oTEL
+
+REQUESTS = Counter("http_server_requests_total", "HTTP requests by route template and status",
+                   ["method", "route", "status"])
+DURATION = Histogram("http_server_request_duration_seconds", "HTTP request duration by route template and status",
+                     ["method", "route", "status"],
+                     buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+
+# Requests that match no route share one label value, so scanners cannot blow up the series count
+UNMATCHED_ROUTE = "unmatched"
+
+
+class HTTPMetricsMiddleware:
+    """
+    Records rate, errors (by status) and duration of HTTP requests per route template. Duration samples carry
+    the trace id as an exemplar when that trace is exported.
+
+    Added outside the middlewares that change the status (DeadlineMiddleware, ETagMiddleware), so it records the
+    status the client gets. That also puts it outside the request span, so the trace is read while the response
+    starts, as the instrumentation sends it from inside the span.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # labels() costs more than recording the sample, so the children are looked up once per label set
+        self._children: dict[tuple[str, str, str], tuple[Counter, Histogram]] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        span_context: trace.SpanContext | None = None
+        start = time.perf_counter()
+
+        async def send_with_status(message: Message):
+            nonlocal status, span_context
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                span_context = trace.get_current_span().get_span_context()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            # Set by the router once a route matched; the path template keeps path parameters out of the labels
+            route = scope.get("route")
+            labels = (scope["method"], route.path if route is not None else UNMATCHED_ROUTE, str(status))
+            children = self._children.get(labels)
+            if children is None:
+                children = self._children[labels] = (REQUESTS.labels(*labels), DURATION.labels(*labels))
+            requests, durations = children
+            requests.inc()
+            durations.observe(duration, oTEL.get_exemplar(span_context, status >= 500, duration))
@@ -1,10 +1,94 @@
+import atexit
+import copy
 import logging
+import queue
 import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from os import getenv
 
-formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+import orjson
+from opentelemetry import trace
+from prometheus_client import Counter
+
+# Read here rather than in src.utils, which logs through this module while loading its own settings
+LOG_FORMAT = getenv("LOG_FORMAT", default="text")
+LOG_FILE = getenv("LOG_FILE", default="app.log")
+LOG_FILE_MAX_BYTES = int(getenv("LOG_FILE_MAX_BYTES", default=str(10 * 1024 * 1024)))
+LOG_FILE_BACKUP_COUNT = int(getenv("LOG_FILE_BACKUP_COUNT", default="5"))
+LOG_QUEUE_SIZE = int(getenv("LOG_QUEUE_SIZE", default="10000"))
+
+DROPPED_RECORDS = Counter("log_records_dropped_total", "Log records dropped because the log queue was full", ["level"])
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, with the trace and span ids of the request that logged the record.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "name": record.name,
+            "message": record.getMessage(),
+        }
+        for attribute in ("trace_id", "span_id"):
+            value = getattr(record, attribute, None)
+            if value is not None:
+                entry[attribute] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return orjson.dumps(entry, default=str).decode()
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread that does the actual I/O. When the queue is full the record is dropped
+    and counted instead of blocking the caller.
+    """
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED_RECORDS.labels(level=record.levelname).inc()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Everything that depends on the caller (arguments, exception, current span) is resolved on this thread
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+
+        span_context = trace.get_current_span().get_span_context()
+        if span_context.is_valid:
+            record.trace_id = format(span_context.trace_id, "032x")
+            record.span_id = format(span_context.span_id, "016x")
+        return record
+
+
+class LogQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Waits for room, as the queue may still be full when the listener is stopped
+        self.queue.put(self._sentinel)
+
+
+if LOG_FORMAT == "json":
+    formatter = JsonFormatter()
+else:
+    formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+exception_formatter = logging.Formatter()
 
 
 logger = logging.getLogger(__name__)
@@ -12,10 +96,15 @@ logger.setLevel(logging.INFO)
 
 console_handler = logging.StreamHandler(sys.stdout)
 console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
 
-file_handler = logging.FileHandler('app.log')
+file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUP_COUNT)
 file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
 
-logger.propagate = False
\ No newline at end of file
+log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+logger.addHandler(DroppingQueueHandler(log_queue))
+queue_listener = LogQueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+queue_listener.start()
+# Flushes the queue on interpreter exit
+atexit.register(queue_listener.stop)
+
+logger.propagate = False
@@ -0,0 +1,248 @@
+import asyncio
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from google.protobuf.message import Message
+from grpc import RpcError
+from prometheus_client import Counter, Gauge, Histogram
+
+from order import order_pb2
+from wallet import wallet_pb2
+from src.connections import aio
+from src.utils import OUTBOX_PATH, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_POLL_SECONDS, OUTBOX_LEASE_SECONDS
+from src.utils.server_timing import measure
+
+from src.utils.logger import logger
+
+MESSAGES = Counter("outbox_messages_total", "Orders_Service replication messages by result", ["method", "result"])
+PENDING = Gauge("outbox_pending_messages", "Replication messages in the outbox by state: queued, dead, or parked "
+                "behind a dead message of the same user", ["state"])
+DELIVERY_LAG = Histogram("outbox_delivery_lag_seconds", "Time from enqueueing to delivery to Orders_Service")
+
+MAX_BACKOFF_SECONDS = 300
+
+# Orders_Service method -> (aio stub attribute, request type)
+ROUTES = {
+    "CreateWallet": ("orders_service_wallet_stub", wallet_pb2.Wallet),
+    "UpdateWallet": ("orders_service_wallet_stub", wallet_pb2.Wallet),
+    "CreateOrder": ("orders_service_order_stub", order_pb2.OrderDetails),
+    "DeleteOrder": ("orders_service_order_stub", order_pb2.OrderDetails),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    method TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    dead INTEGER NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    lease_until REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (dead, next_attempt_at);
+"""
+
+# Added to outbox files created before the leases
+LEASE_COLUMNS = {
+    "claimed_by": "ALTER TABLE outbox ADD COLUMN claimed_by TEXT",
+    "lease_until": "ALTER TABLE outbox ADD COLUMN lease_until REAL NOT NULL DEFAULT 0",
+}
+
+# Leases a batch to one process. A user whose oldest message waits for a retry, or who has messages leased to
+# any process, is skipped, so their messages never overtake each other. So is a user with a dead message: their
+# later messages stay parked until an operator deletes it.
+CLAIM = """
+UPDATE outbox SET claimed_by = :owner, lease_until = :now + :lease
+WHERE id IN (
+    SELECT id FROM outbox
+    WHERE dead = 0 AND user_id NOT IN (
+        SELECT user_id FROM outbox WHERE dead = 1 OR next_attempt_at > :now OR lease_until > :now
+    )
+    ORDER BY id LIMIT :limit
+)
+RETURNING id, user_id, method, payload, created_at, attempts
+"""
+RELEASE = "UPDATE outbox SET claimed_by = NULL, lease_until = 0 WHERE claimed_by = ?"
+
+COUNT_BY_STATE = """
+SELECT CASE WHEN dead = 1 THEN 'dead'
+            WHEN user_id IN (SELECT user_id FROM outbox WHERE dead = 1) THEN 'parked'
+            ELSE 'queued' END AS state, COUNT(*)
+FROM outbox GROUP BY state
+"""
+
+
+class Outbox:
+    """
+    Durable SQLite queue of Orders_Service writes, filled once DB_Manager has accepted the primary write.
+
+    A background worker claims batches in insertion order and delivers them - concurrently across users,
+    in order within a user - retrying failures with exponential backoff. A message still failing after
+    max_attempts is kept as dead and logged, and parks the user's later messages until it is deleted. Delivery is at least once: a message sent right before a
+    crash or shutdown is sent again on the next start.
+
+    Processes may share the file: a claim leases the messages to this process for lease seconds, and a crashed
+    process's messages are claimed again once their lease expires.
+
+    SQLite is only touched from a single dedicated thread, so the event loop never waits on disk.
+    """
+
+    def __init__(self, path: str, batch_size: int, max_attempts: int, poll_interval: float, lease: float):
+        self.path = path
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.owner = uuid.uuid4().hex
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+        self._connection: sqlite3.Connection | None = None
+        self._wakeup = asyncio.Event()
+        self._worker_task: asyncio.Task | None = None
+
+    async def start(self):
+        await self._run(self._open)
+        self._worker_task = asyncio.create_task(self._deliver_loop())
+        self._worker_task.add_done_callback(self._log_worker_exit)
+
+    async def stop(self):
+        if self._worker_task is not None:
+            self._worker_task.cancel()
+            await asyncio.gather(self._worker_task, return_exceptions=True)
+            self._worker_task = None
+        await self._run(self._close)
+
+    async def enqueue(self, user_id: str, *messages: tuple[str, Message]):
+        """
+        Stores (method, request) pairs for one user in a single transaction.
+        """
+        with measure("outbox"):
+            await self._run(self._insert, user_id,
+                            [(method, message.SerializeToString()) for method, message in messages])
+        self._wakeup.set()
+
+    async def deliver_batch(self) -> int:
+        rows = await self._run(self._claim)
+
+        by_user: dict[str, list[tuple]] = {}
+        for row in rows:
+            by_user.setdefault(row[1], []).append(row)
+
+        results = await asyncio.gather(*(self._deliver_user(user_rows) for user_rows in by_user.values()))
+        delivered = [message_id for user_delivered, _ in results for message_id in user_delivered]
+        failed = [failed_row for _, failed_row in results if failed_row is not None]
+        await self._run(self._settle, delivered, failed)
+        return len(rows)
+
+    async def _deliver_user(self, rows: list[tuple]) -> tuple[list[int], tuple | None]:
+        delivered = []
+        for row in rows:
+            message_id, _, method, payload, created_at, attempts = row
+            try:
+                stub_name, request_type = ROUTES[method]
+                await getattr(getattr(aio, stub_name), method)(request_type.FromString(payload))
+            except RpcError as e:
+                logger.warning(f"Replicating {method} to Orders_Service failed (attempt {attempts + 1}): {e}")
+                return delivered, row
+            except Exception:
+                logger.exception(f"Replicating {method} to Orders_Service failed (attempt {attempts + 1})")
+                return delivered, row
+
+            MESSAGES.labels(method=method, result="delivered").inc()
+            DELIVERY_LAG.observe(max(time.time() - created_at, 0))
+            delivered.append(message_id)
+        return delivered, None
+
+    async def _deliver_loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                claimed = await self.deliver_batch()
+            except Exception:
+                logger.exception("Outbox delivery failed")
+                claimed = 0
+
+            if claimed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    @staticmethod
+    def _log_worker_exit(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Outbox delivery stopped", exc_info=task.exception())
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _open(self):
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.executescript(SCHEMA)
+        # Under the write lock, as processes sharing the file may start together
+        self._connection.execute("BEGIN IMMEDIATE")
+        with self._connection:
+            columns = {column[1] for column in self._connection.execute("PRAGMA table_info(outbox)")}
+            for column, statement in LEASE_COLUMNS.items():
+                if column not in columns:
+                    self._connection.execute(statement)
+        self._update_pending()
+        logger.info(f"Outbox opened at {self.path}")
+
+    def _close(self):
+        if self._connection is not None:
+            with self._connection:
+                self._connection.execute(RELEASE, (self.owner,))
+            self._connection.close()
+            self._connection = None
+
+    def _insert(self, user_id: str, messages: list[tuple[str, bytes]]):
+        now = time.time()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO outbox (user_id, method, payload, created_at, next_attempt_at) VALUES (?, ?, ?, ?, ?)",
+                [(user_id, method, payload, now, now) for method, payload in messages])
+        PENDING.labels(state="queued").inc(len(messages))
+
+    def _claim(self) -> list[tuple]:
+        # Takes the write lock before reading, so processes sharing the file claim one after another
+        self._connection.execute("BEGIN IMMEDIATE")
+        with self._connection:
+            rows = self._connection.execute(CLAIM, {"owner": self.owner, "now": time.time(), "lease": self.lease,
+                                                    "limit": self.batch_size}).fetchall()
+        # RETURNING does not keep the subquery's order
+        return sorted(rows)
+
+    def _settle(self, delivered: list[int], failed: list[tuple]):
+        now = time.time()
+        with self._connection:
+            self._connection.executemany("DELETE FROM outbox WHERE id = ?", [(message_id,) for message_id in delivered])
+            for message_id, user_id, method, _, _, attempts in failed:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    MESSAGES.labels(method=method, result="dead").inc()
+                    logger.error(f"Giving up replicating {method} for user {user_id} after {attempts} attempts, "
+                                 f"their later messages are parked until message {message_id} is deleted")
+                    self._connection.execute("UPDATE outbox SET attempts = ?, dead = 1 WHERE id = ?",
+                                             (attempts, message_id))
+                else:
+                    MESSAGES.labels(method=method, result="retried").inc()
+                    self._connection.execute("UPDATE outbox SET attempts = ?, next_attempt_at = ? WHERE id = ?",
+                                             (attempts, now + min(2 ** attempts, MAX_BACKOFF_SECONDS), message_id))
+            # Also frees the messages queued behind a failed one, which were claimed but not sent
+            self._connection.execute(RELEASE, (self.owner,))
+        self._update_pending()
+
+    def _update_pending(self):
+        counts = dict(self._connection.execute(COUNT_BY_STATE).fetchall())
+        for state in ("queued", "parked", "dead"):
+            PENDING.labels(state=state).set(counts.get(state, 0))
+
+
+outbox = Outbox(OUTBOX_PATH, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_POLL_SECONDS, OUTBOX_LEASE_SECONDS)
@@ -1,54 +1,159 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import time
+from timeit import default_timer
+
 from apscheduler.schedulers.background import BackgroundScheduler
+import requests
+from requests.adapters import HTTPAdapter
 import stripe
 from google.protobuf.json_format import MessageToDict
 from grpc import RpcError
+from prometheus_client import Gauge, Histogram
 
 from payment import payment_pb2, payment_state_pb2
 from src.connections import payment_stub
+from src.utils import PAYMENT_POLL_WORKERS, PAYMENT_RECONCILE_SECONDS, PAYMENT_SCHEDULER_LOCK_PATH, \
+    PAYMENT_SCHEDULER_ELECTION_SECONDS, PAYMENT_CHECK_MIN_SECONDS, PAYMENT_CHECK_MAX_SECONDS
+from src.utils.leader_lock import LeaderLock
+from src.utils.session_backoff import SessionBackoff
 
 from src.utils.logger import logger
 
+RUN_DURATION = Histogram("payment_scheduler_run_seconds", "Duration of a payment scheduler run",
+                         buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+BACKLOG = Gauge("payment_scheduler_backlog", "Unpaid payments found by the last payment scheduler run")
+DUE_SESSIONS = Gauge("payment_scheduler_due_sessions", "Checkout Sessions checked by the last payment scheduler run")
+STRIPE_LATENCY = Histogram("stripe_request_seconds", "Latency of Stripe API calls", ["operation", "result"])
+LEADER = Gauge("payment_scheduler_leader", "Whether this process runs the payment scheduler")
+
+# Sessions are checked and payments updated by a bounded pool of workers
+poll_executor = ThreadPoolExecutor(max_workers=PAYMENT_POLL_WORKERS, thread_name_prefix="payment-poll")
+# Only touched by the scheduler job, which never overlaps itself
+session_checks = SessionBackoff(PAYMENT_CHECK_MIN_SECONDS, PAYMENT_CHECK_MAX_SECONDS)
+
+
+def create_stripe_http_client(pool_size: int) -> stripe.RequestsClient:
+    # Without a session RequestsClient opens one per thread; a shared one keeps a single keep-alive pool
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return stripe.RequestsClient(session=session)
+
+
+stripe.default_http_client = create_stripe_http_client(PAYMENT_POLL_WORKERS)
+
 
-def setup_payments_scheduler():
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(check_for_payments, 'interval', seconds=60)
-    scheduler.start()
+class PaymentScheduler:
+    """
+    Runs the reconciliation sweep in a single process out of all API workers and replicas. Every process
+    tries to take the leader lock; followers retry on an interval and take over once the leader exits.
+
+    Payments are settled by the Stripe webhook; the sweep only reconciles events that never arrived. It runs
+    often, but only checks the sessions SessionBackoff reports as due.
+    """
+
+    def __init__(self, lock: LeaderLock, election_interval: float):
+        self.lock = lock
+        self.election_interval = election_interval
+        self._scheduler: BackgroundScheduler | None = None
+
+    def start(self):
+        self._scheduler = BackgroundScheduler()
+        self._scheduler.add_job(self._elect, 'interval', seconds=self.election_interval, id="leader_election",
+                                coalesce=True, next_run_time=datetime.now())
+        self._scheduler.start()
+
+    def stop(self):
+        if self._scheduler is not None:
+            self._scheduler.shutdown(wait=False)
+            self._scheduler = None
+        self.lock.release()
+        LEADER.set(0)
+
+    def _elect(self):
+        if not self.lock.try_acquire():
+            return
+
+        logger.info(f"Elected payment scheduler leader through {self.lock.path}")
+        LEADER.set(1)
+        self._scheduler.remove_job("leader_election")
+        self._scheduler.add_job(check_for_payments, 'interval', seconds=PAYMENT_RECONCILE_SECONDS, coalesce=True)
 
 
 def check_for_payments():
     logger.info(f"Scheduler running...")
-    message = payment_pb2.UnpaidSessions(unpaid=True)
-    pending_payments: payment_pb2.PaymentList = payment_stub.GetUnpaidPayments(message)
-
-    for payment in pending_payments.payments:
+    with RUN_DURATION.time():
+        message = payment_pb2.UnpaidSessions(unpaid=True)
+        pending_payments: payment_pb2.PaymentList = payment_stub.GetUnpaidPayments(message)
+        BACKLOG.set(len(pending_payments.payments))
 
-        payment_status, session_status = get_session_status(payment.id)
-        if (session_status is None and session_status == "open") or payment_status is None:
-            continue
+        now = time.time()
+        session_checks.sync((payment.id for payment in pending_payments.payments), now)
+        payment_ids = session_checks.due(now)
+        DUE_SESSIONS.set(len(payment_ids))
 
-        try:
-            if payment_status == 'paid' and session_status == 'complete':
-                update_message = payment_pb2.PaymentDetails(id=payment.id,
-                                                            state=payment_state_pb2.PAYMENT_STATE_ACCEPTED)
+        update_messages = []
+        for payment_id, session in zip(payment_ids, poll_executor.map(retrieve_session, payment_ids)):
+            update_message = None if session is None else payment_update(payment_id, (session.payment_status,
+                                                                                      session.status))
+            if update_message is not None:
+                update_messages.append(update_message)
+            elif session is not None:
+                session_checks.reschedule(payment_id, now, session.created, session.expires_at)
+            else:
+                session_checks.reschedule(payment_id, now)
 
-            elif payment_status == 'payment_failed' or session_status == "expired":
-                update_message = payment_pb2.PaymentDetails(id=payment.id,
-                                                            state=payment_state_pb2.PAYMENT_STATE_CANCELLED)
+        # Updates of the run are sent together once every due session has been checked
+        for update_message, updated in zip(update_messages, poll_executor.map(update_payment, update_messages)):
+            if updated:
+                session_checks.finish(update_message.id)
             else:
-                continue
-            response: payment_pb2.PaymentDetails = payment_stub.UpdatePayment(update_message)
-            logger.info(f"Payment {payment.id} has been updated. {MessageToDict(response)}")
-        except RpcError as e:
-            logger.error(f"Problem with updating payment status: {payment.id}. Error: {e}")
+                session_checks.reschedule(update_message.id, now)
     logger.info("Scheduler finished")
 
 
+def payment_update(payment_id: str, status: tuple[str | None, str | None]) -> payment_pb2.PaymentDetails | None:
+    payment_status, session_status = status
+    if (session_status is None and session_status == "open") or payment_status is None:
+        return None
+
+    if payment_status == 'paid' and session_status == 'complete':
+        return payment_pb2.PaymentDetails(id=payment_id, state=payment_state_pb2.PAYMENT_STATE_ACCEPTED)
+    if payment_status == 'payment_failed' or session_status == "expired":
+        return payment_pb2.PaymentDetails(id=payment_id, state=payment_state_pb2.PAYMENT_STATE_CANCELLED)
+    return None
+
+
+def update_payment(update_message: payment_pb2.PaymentDetails) -> bool:
+    try:
+        response: payment_pb2.PaymentDetails = payment_stub.UpdatePayment(update_message)
+        logger.info(f"Payment {update_message.id} has been updated. {MessageToDict(response)}")
+        return True
+    except RpcError as e:
+        logger.error(f"Problem with updating payment status: {update_message.id}. Error: {e}")
+        return False
+
+
 def get_session_status(session_id):
+    session = retrieve_session(session_id)
+    if session is None:
+        return None, None
+    return session.payment_status, session.status
+
+
+def retrieve_session(session_id) -> stripe.checkout.Session | None:
+    start = default_timer()
+    result = "success"
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
-        session_payment_status = session.payment_status
-        session_status = session.status
-        return session_payment_status, session_status
+        return stripe.checkout.Session.retrieve(session_id)
     except stripe.error.StripeError as e:
+        result = "error"
         logger.error(f'Problems with stripe in Scheduler: {e}')
-        return None, None
+        return None
+    finally:
+        STRIPE_LATENCY.labels(operation="session_retrieve", result=result).observe(max(default_timer() - start, 0))
+
+
+payment_scheduler = PaymentScheduler(LeaderLock(PAYMENT_SCHEDULER_LOCK_PATH), PAYMENT_SCHEDULER_ELECTION_SECONDS)
@@ -0,0 +1,116 @@
+import asyncio
+import time
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+
+from grpc import RpcError
+from prometheus_client import Counter, Gauge, Histogram
+
+from coins import coins_pb2
+from src.connections import aio
+from src.utils import PRICE_SNAPSHOT_REFRESH_SECONDS, PRICE_SNAPSHOT_MAX_STALE_SECONDS
+from src.utils.deadline import detached
+from src.utils.proto_json import message_to_dict
+
+from src.utils.logger import logger
+
+SNAPSHOT_AGE = Gauge("price_snapshot_age_seconds", "Age of the GetAllCoinsPrices snapshot served to readers")
+REFRESH_LATENCY = Histogram("price_snapshot_refresh_seconds", "Latency of GetAllCoinsPrices snapshot refreshes")
+REFRESH_FAILURES = Counter("price_snapshot_refresh_failures_total", "Failed GetAllCoinsPrices snapshot refreshes")
+
+
+class PriceSnapshot(NamedTuple):
+    prices: Mapping[str, Mapping[str, float]]
+    fetched_at: float
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
+class PriceSnapshotService:
+    """
+    Keeps the latest GetAllCoinsPrices response in memory and refreshes it in the background.
+
+    Readers get the current snapshot without an RPC. A snapshot older than the refresh interval is
+    still served while a refresh runs in the background; only a snapshot older than max_stale makes
+    the reader wait for a fresh one.
+    """
+
+    def __init__(self, refresh_interval: float, max_stale: float):
+        self.refresh_interval = refresh_interval
+        self.max_stale = max_stale
+        self._snapshot: PriceSnapshot | None = None
+        self._refresh_task: asyncio.Task | None = None
+        self._loop_task: asyncio.Task | None = None
+
+        SNAPSHOT_AGE.set_function(lambda: self._snapshot.age if self._snapshot is not None else float("nan"))
+
+    async def start(self):
+        try:
+            await self.refresh()
+        except RpcError as e:
+            logger.error(f"Initial price snapshot could not be fetched: {e}")
+        self._loop_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        tasks = [task for task in (self._loop_task, self._refresh_task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        # Waited for, so the channels are not closed under a refresh that is still unwinding
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+        self._refresh_task = None
+
+    async def get(self) -> PriceSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.age > self.max_stale:
+            await self._shared_refresh()
+            return self._snapshot
+
+        if snapshot.age > self.refresh_interval:
+            self._background_refresh()
+        return snapshot
+
+    async def refresh(self):
+        start = time.perf_counter()
+        try:
+            response: coins_pb2.DataResponse = await aio.prices_stub.GetAllCoinsPrices(
+                coins_pb2.AllCoinsPricesRequest()
+            )
+        except RpcError:
+            REFRESH_FAILURES.inc()
+            raise
+        finally:
+            REFRESH_LATENCY.observe(time.perf_counter() - start)
+
+        data = message_to_dict(response).get("data", {})
+        prices = MappingProxyType({coin: MappingProxyType(dict(values)) for coin, values in data.items()})
+        self._snapshot = PriceSnapshot(prices=prices, fetched_at=time.monotonic())
+
+    def _background_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            # Shared with later readers and the refresh loop, so it must not inherit this request's deadline
+            with detached():
+                self._refresh_task = asyncio.create_task(self.refresh())
+            self._refresh_task.add_done_callback(self._log_refresh_failure)
+        return self._refresh_task
+
+    async def _shared_refresh(self):
+        await asyncio.shield(self._background_refresh())
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self._shared_refresh()
+            except RpcError:
+                pass
+
+    @staticmethod
+    def _log_refresh_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Refreshing price snapshot failed: {task.exception()}")
+
+
+price_snapshot = PriceSnapshotService(PRICE_SNAPSHOT_REFRESH_SECONDS, PRICE_SNAPSHOT_MAX_STALE_SECONDS)
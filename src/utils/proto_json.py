@@ -0,0 +1,218 @@
+import base64
+import math
+from collections.abc import Callable
+from typing import Any, Mapping
+
+import orjson
+from fastapi.responses import JSONResponse
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+from google.protobuf.internal import type_checkers
+from google.protobuf.json_format import MessageToDict, SerializeToJsonError
+from google.protobuf.message import Message
+from starlette.background import BackgroundTask
+
+from src.utils.server_timing import measure
+
+# Converters are compiled once per (message type, always_print_fields_with_no_presence) and produce
+# the same objects as MessageToDict(..., preserving_proto_field_name=True), without its per-field reflection.
+Converter = Callable[[Any], Any]
+
+_INT64_TYPES = (FieldDescriptor.CPPTYPE_INT64, FieldDescriptor.CPPTYPE_UINT64)
+_FALLBACK_TYPES = {
+    "google.protobuf.Any",
+    "google.protobuf.Duration",
+    "google.protobuf.FieldMask",
+    "google.protobuf.Timestamp",
+}
+
+message_converters: dict[tuple[Descriptor, bool], Converter] = {}
+
+
+def message_to_dict(message: Message, always_print_fields_with_no_presence: bool = False) -> Any:
+    key = (message.DESCRIPTOR, always_print_fields_with_no_presence)
+    converter = message_converters.get(key)
+    if converter is None:
+        converter = message_converters[key] = compile_message(*key)
+    return converter(message)
+
+
+def compile_message(descriptor: Descriptor, always_print: bool) -> Converter:
+    full_name = descriptor.full_name
+    if full_name == "google.protobuf.Struct":
+        return struct_to_json
+    if full_name == "google.protobuf.ListValue":
+        return list_value_to_json
+    if full_name == "google.protobuf.Value":
+        return value_to_json
+    if full_name in _FALLBACK_TYPES or descriptor.file.name == "google/protobuf/wrappers.proto":
+        return lambda message: MessageToDict(message,
+                                             preserving_proto_field_name=True,
+                                             always_print_fields_with_no_presence=always_print)
+
+    fields = {field.number: (field.name, compile_field(field, always_print)) for field in descriptor.fields}
+
+    # (name, value, factory) - factory builds a fresh container so callers can mutate the result
+    defaults = []
+    if always_print:
+        for field in descriptor.fields:
+            if field.has_presence:
+                continue
+            if is_map_entry(field):
+                defaults.append((field.name, None, dict))
+            elif field.label == FieldDescriptor.LABEL_REPEATED:
+                defaults.append((field.name, None, list))
+            else:
+                converter = compile_value(field, always_print)
+                value = field.default_value if converter is None else converter(field.default_value)
+                defaults.append((field.name, value, None))
+
+    def convert(message: Message) -> dict:
+        js = {}
+        for field, value in message.ListFields():
+            name, converter = fields.get(field.number) or (f"[{field.full_name}]", compile_field(field, always_print))
+            js[name] = value if converter is None else converter(value)
+        for name, value, factory in defaults:
+            if name not in js:
+                js[name] = value if factory is None else factory()
+        return js
+
+    return convert
+
+
+def compile_field(field: FieldDescriptor, always_print: bool) -> Converter | None:
+    if is_map_entry(field):
+        value_converter = compile_value(field.message_type.fields_by_name["value"], always_print)
+
+        def convert_map(value: Mapping) -> dict:
+            js = {}
+            for key in value:
+                recorded_key = ("true" if key else "false") if isinstance(key, bool) else str(key)
+                js[recorded_key] = value[key] if value_converter is None else value_converter(value[key])
+            return js
+
+        return convert_map
+
+    converter = compile_value(field, always_print)
+    if field.label == FieldDescriptor.LABEL_REPEATED:
+        if converter is None:
+            return list
+        return lambda values: [converter(value) for value in values]
+    return converter
+
+
+def compile_value(field: FieldDescriptor, always_print: bool) -> Converter | None:
+    """
+    Returns None when the value is already what MessageToDict would emit.
+    """
+    cpp_type = field.cpp_type
+    if cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+        return lambda message: message_to_dict(message, always_print)
+    if cpp_type == FieldDescriptor.CPPTYPE_ENUM:
+        return compile_enum(field)
+    if field.type == FieldDescriptor.TYPE_BYTES:
+        return lambda value: base64.b64encode(value).decode("utf-8")
+    if cpp_type in _INT64_TYPES:
+        return str
+    if cpp_type == FieldDescriptor.CPPTYPE_FLOAT:
+        return lambda value: non_finite_float(value) or type_checkers.ToShortestFloat(value)
+    if cpp_type == FieldDescriptor.CPPTYPE_DOUBLE:
+        return lambda value: non_finite_float(value) or value
+    return None
+
+
+def compile_enum(field: FieldDescriptor) -> Converter:
+    enum_type = field.enum_type
+    if enum_type.full_name == "google.protobuf.NullValue":
+        return lambda value: None
+
+    names = {value.number: value.name for value in enum_type.values}
+    is_closed = enum_type.is_closed
+
+    def convert_enum(value: int) -> str | int:
+        name = names.get(value)
+        if name is not None:
+            return name
+        if is_closed:
+            raise SerializeToJsonError("Enum field contains an integer value which can not mapped to an enum value.")
+        return value
+
+    return convert_enum
+
+
+def non_finite_float(value: float) -> str | None:
+    if math.isinf(value):
+        return "-Infinity" if value < 0.0 else "Infinity"
+    if math.isnan(value):
+        return "NaN"
+    return None
+
+
+def is_map_entry(field: FieldDescriptor) -> bool:
+    return (field.type == FieldDescriptor.TYPE_MESSAGE
+            and field.message_type.has_options
+            and field.message_type.GetOptions().map_entry)
+
+
+def struct_to_json(message) -> dict:
+    fields = message.fields
+    return {key: value_to_json(fields[key]) for key in fields}
+
+
+def list_value_to_json(message) -> list:
+    return [value_to_json(value) for value in message.values]
+
+
+def value_to_json(message) -> Any:
+    kind = message.WhichOneof("kind")
+    if kind == "number_value":
+        value = message.number_value
+        if math.isinf(value):
+            raise ValueError("Fail to serialize Infinity for Value.number_value, which would parse as string_value")
+        if math.isnan(value):
+            raise ValueError("Fail to serialize NaN for Value.number_value, which would parse as string_value")
+        return value
+    if kind == "string_value":
+        return message.string_value
+    if kind == "list_value":
+        return list_value_to_json(message.list_value)
+    if kind == "struct_value":
+        return struct_to_json(message.struct_value)
+    if kind == "bool_value":
+        return message.bool_value
+    return None
+
+
+def render_json(content: Any, always_print_fields_with_no_presence: bool = False) -> bytes:
+    """
+    The body ProtoJSONResponse renders for content, for payloads cached in their rendered form.
+    """
+    return ProtoJSONResponse(content, always_print_fields_with_no_presence=always_print_fields_with_no_presence).body
+
+
+class ProtoJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson that also accepts protobuf messages, at the top level or nested in
+    dicts and lists. The converted object stays available as `content` for endpoints calling each other.
+    """
+
+    def __init__(self,
+                 content: Any,
+                 status_code: int = 200,
+                 headers: Mapping[str, str] | None = None,
+                 media_type: str | None = None,
+                 background: BackgroundTask | None = None,
+                 always_print_fields_with_no_presence: bool = False):
+        self.always_print_fields_with_no_presence = always_print_fields_with_no_presence
+        super().__init__(content, status_code, headers, media_type, background)
+
+    def render(self, content: Any) -> bytes:
+        with measure("serialize"):
+            if isinstance(content, Message):
+                content = message_to_dict(content, self.always_print_fields_with_no_presence)
+            self.content = content
+            return orjson.dumps(content, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+
+    def default(self, obj: Any) -> Any:
+        if isinstance(obj, Message):
+            return message_to_dict(obj, self.always_print_fields_with_no_presence)
+        raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
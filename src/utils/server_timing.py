@@ -0,0 +1,80 @@
+import time
+from collections.abc import Callable
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.utils import SERVER_TIMING_ENABLED
+
+
+class ServerTiming:
+    """
+    Durations collected while handling one request, rendered as a Server-Timing header.
+    """
+
+    def __init__(self):
+        self.entries: list[tuple[str, float, str | None]] = []
+
+    def add(self, name: str, seconds: float, description: str | None = None):
+        self.entries.append((name, seconds * 1000, description))
+
+    def header(self) -> str:
+        return ", ".join(f'{name};dur={duration:.1f}' + (f';desc="{description}"' if description else "")
+                         for name, duration, description in self.entries)
+
+
+# Set only for requests that get the header, so collecting costs nothing for the others
+current_timing: ContextVar[ServerTiming | None] = ContextVar("server_timing", default=None)
+
+
+@contextmanager
+def measure(name: str):
+    timing = current_timing.get()
+    if timing is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
+
+
+class ServerTimingMiddleware:
+    """
+    Sends a Server-Timing header breaking the request down into backend RPCs, auth, password hashing, outbox
+    writes and serialization, plus the total time until the response started.
+
+    As it exposes the backend calls behind each endpoint, it is only sent when SERVER_TIMING_ENABLED is set or
+    authorized accepts the request's Authorization header.
+    """
+
+    def __init__(self, app: ASGIApp, authorized: Callable[[str | None], bool],
+                 enabled: bool = SERVER_TIMING_ENABLED):
+        self.app = app
+        self.authorized = authorized
+        self.enabled = enabled
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not (
+                self.enabled or self.authorized(Headers(scope=scope).get("authorization"))):
+            await self.app(scope, receive, send)
+            return
+
+        timing = ServerTiming()
+        token = current_timing.set(timing)
+        start = time.perf_counter()
+
+        async def send_with_timing(message: Message):
+            if message["type"] == "http.response.start":
+                timing.add("total", time.perf_counter() - start)
+                MutableHeaders(scope=message).append("Server-Timing", timing.header())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timing.reset(token)
@@ -0,0 +1,94 @@
+import heapq
+from collections.abc import Iterable
+
+# The next check of a session comes after this fraction of its age, so checks thin out geometrically
+AGE_RATIO = 0.1
+# The final check waits for Stripe to flip an unpaid session to expired
+FINAL_CHECK_DELAY = 60
+
+
+class SessionCheck:
+    __slots__ = ("next_check", "created", "expires_at", "final", "done")
+
+    def __init__(self):
+        self.next_check = 0.0
+        self.created: float | None = None
+        self.expires_at: float | None = None
+        self.final = False
+        self.done = False
+
+
+class SessionBackoff:
+    """
+    Decides when each unpaid Checkout Session is checked again. Sessions sit in a heap ordered by their next
+    check: a new session is checked right away, after that the interval grows with the session's age between
+    min_interval and max_interval, and a session past its expires_at gets one final check.
+
+    Heap entries are removed lazily - an entry whose time no longer matches its session is skipped.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._heap: list[tuple[float, str]] = []
+        self._sessions: dict[str, SessionCheck] = {}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def sync(self, payment_ids: Iterable[str], now: float):
+        """
+        Tracks exactly the given unpaid payments - new ones are due immediately, settled ones are forgotten.
+        """
+        unpaid = set(payment_ids)
+        for payment_id in self._sessions.keys() - unpaid:
+            del self._sessions[payment_id]
+        for payment_id in unpaid - self._sessions.keys():
+            self._schedule(payment_id, SessionCheck(), now)
+
+        if len(self._heap) > 2 * len(self._sessions) + 64:
+            self._heap = [(check.next_check, payment_id) for payment_id, check in self._sessions.items()
+                          if not check.done]
+            heapq.heapify(self._heap)
+
+    def due(self, now: float) -> list[str]:
+        payment_ids = []
+        while self._heap and self._heap[0][0] <= now:
+            next_check, payment_id = heapq.heappop(self._heap)
+            check = self._sessions.get(payment_id)
+            if check is not None and not check.done and check.next_check == next_check:
+                payment_ids.append(payment_id)
+        return payment_ids
+
+    def reschedule(self, payment_id: str, now: float, created: float | None = None, expires_at: float | None = None):
+        """
+        Schedules the next check of a session that is still unsettled, using its Stripe timestamps when known.
+        """
+        check = self._sessions.get(payment_id)
+        if check is None:
+            return
+        if check.final:
+            check.done = True
+            return
+
+        if created is not None:
+            check.created = created
+        if expires_at is not None:
+            check.expires_at = expires_at
+
+        age = now - check.created if check.created is not None else 0
+        next_check = now + min(max(age * AGE_RATIO, self.min_interval), self.max_interval)
+        if check.expires_at is not None and next_check >= check.expires_at + FINAL_CHECK_DELAY:
+            next_check = max(check.expires_at + FINAL_CHECK_DELAY, now)
+            check.final = True
+        self._schedule(payment_id, check, next_check)
+
+    def finish(self, payment_id: str):
+        check = self._sessions.get(payment_id)
+        if check is not None:
+            check.done = True
+
+    def _schedule(self, payment_id: str, check: SessionCheck, next_check: float):
+        check.next_check = next_check
+        self._sessions[payment_id] = check
+        heapq.heappush(self._heap, (next_check, payment_id))
@@ -0,0 +1,54 @@
+import asyncio
+
+import grpc
+from google.protobuf.message import Message
+from prometheus_client import Counter
+
+from src.utils.deadline import detached, mark_deadline_exceeded, rpc_timeout
+
+CALLS = Counter("singleflight_calls_total", "Coalesced read RPCs by result", ["grpc_method", "result"])
+
+
+class SingleFlight:
+    """
+    Shares one in-flight unary RPC between concurrent callers sending the same request to the same stub method.
+
+    Callers receive the same response message, so they must not modify it. The shared call is shielded,
+    so a caller that goes away (client disconnect) does not cancel it for the others.
+
+    The shared call runs without any caller's request deadline. Each caller waits for it only until its own
+    deadline and then fails with DEADLINE_EXCEEDED, so a caller with a short budget does not fail the others.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[tuple[object, str, bytes], asyncio.Future] = {}
+
+    async def call(self, stub, method_name: str, request: Message) -> Message:
+        key = (stub, method_name, request.SerializeToString(deterministic=True))
+
+        call = self._in_flight.get(key)
+        if call is not None:
+            CALLS.labels(grpc_method=method_name, result="coalesced").inc()
+        else:
+            CALLS.labels(grpc_method=method_name, result="executed").inc()
+            with detached():
+                call = asyncio.ensure_future(getattr(stub, method_name)(request))
+            self._in_flight[key] = call
+            call.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        timeout, _ = rpc_timeout()
+        try:
+            return await asyncio.wait_for(asyncio.shield(call), timeout)
+        except asyncio.TimeoutError:
+            CALLS.labels(grpc_method=method_name, result="deadline_exceeded").inc()
+            mark_deadline_exceeded()
+            raise grpc.aio.AioRpcError(grpc.StatusCode.DEADLINE_EXCEEDED, grpc.aio.Metadata(), grpc.aio.Metadata(),
+                                       "Deadline Exceeded while waiting for a shared call")
+        except grpc.RpcError as e:
+            # The shared call itself ran out of the per-RPC timeout
+            if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+                mark_deadline_exceeded()
+            raise
+
+
+singleflight = SingleFlight()
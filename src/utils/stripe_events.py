@@ -0,0 +1,61 @@
+from collections import OrderedDict
+
+from prometheus_client import Counter
+
+from payment import payment_pb2, payment_state_pb2
+from src.utils import STRIPE_EVENT_CACHE_SIZE
+from src.utils.payment_scheduler import payment_update
+
+WEBHOOK_EVENTS = Counter("stripe_webhook_events_total", "Stripe webhook events by type and result", ["type", "result"])
+
+SESSION_EVENTS = {
+    "checkout.session.completed",
+    "checkout.session.async_payment_succeeded",
+    "checkout.session.async_payment_failed",
+    "checkout.session.expired",
+}
+
+
+def payment_update_for_event(event) -> payment_pb2.PaymentDetails | None:
+    """
+    Returns the payment update for a Checkout Session event, or None when the payment stays as it is.
+    """
+    if event.type not in SESSION_EVENTS:
+        return None
+
+    session = event.data.object
+    if event.type == "checkout.session.async_payment_failed":
+        return payment_pb2.PaymentDetails(id=session.id, state=payment_state_pb2.PAYMENT_STATE_CANCELLED)
+    # A completed session paid with a delayed method stays pending until async_payment_succeeded
+    return payment_update(session.id, (session.payment_status, session.status))
+
+
+class EventDeduplicator:
+    """
+    Remembers the ids of handled Stripe events. Stripe delivers at least once and retries for days, so a
+    redelivered or concurrently delivered event is acknowledged without updating the payment again.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._handled: OrderedDict[str, None] = OrderedDict()
+        self._in_progress: set[str] = set()
+
+    def claim(self, event_id: str) -> bool:
+        if event_id in self._handled or event_id in self._in_progress:
+            return False
+        self._in_progress.add(event_id)
+        return True
+
+    def complete(self, event_id: str):
+        self._in_progress.discard(event_id)
+        self._handled[event_id] = None
+        while len(self._handled) > self.max_size:
+            self._handled.popitem(last=False)
+
+    def release(self, event_id: str):
+        # The event failed and Stripe will deliver it again
+        self._in_progress.discard(event_id)
+
+
+stripe_events = EventDeduplicator(STRIPE_EVENT_CACHE_SIZE)